@@ -1,5 +1,13 @@
+import os
+import threading
+
 import streamlit as st
-from components.sidebar import sidebar_navigation
+from components.sidebar import painel_datasets, painel_metricas_rag, sidebar_navigation
+from rag_docling import get_docling_pool
+from rag_embeddings import get_embeddings
+from rag_jobs import get_ingestion_worker
+from rag_section import busca_global
+from rag_tracing import start_metrics_server
 from modules import (
     supermercado,
     distribuicao,
@@ -14,13 +22,44 @@ from modules import (
 # Configuração da página
 st.set_page_config(page_title="Universal System", layout="wide")
 
+
+# Aquecimento opcional dos modelos do RAG (uma vez por processo)
+@st.cache_resource(show_spinner=False)
+def _aquecer_rag() -> None:
+    for aquecer in (get_docling_pool().warm_up, get_embeddings().warm_up):
+        threading.Thread(target=aquecer, daemon=True).start()
+
+
+if os.getenv("RAG_WARMUP") == "1":
+    _aquecer_rag()
+
+
+# Endpoint /metrics (texto Prometheus) — uma vez por processo
+@st.cache_resource(show_spinner=False)
+def _iniciar_metricas() -> None:
+    start_metrics_server()
+
+
+_iniciar_metricas()
+
+
+# Worker de ingestão — retoma jobs interrompidos por um reinício do servidor
+@st.cache_resource(show_spinner=False)
+def _iniciar_ingestao() -> None:
+    get_ingestion_worker()
+
+
+_iniciar_ingestao()
+
 # Sidebar de navegação
 pagina = sidebar_navigation()
+painel_metricas_rag()
 
 # Roteamento de páginas
 if pagina == "🏠 Início":
     st.title("Bem-vindo ao Universal System")
     st.write("Selecione um módulo no menu lateral.")
+    busca_global()
 
 elif pagina == "🛒 Supermercado":
     supermercado.exibir()
@@ -46,3 +85,6 @@ elif pagina == "✈️ Turismo":
 elif pagina == "🍽️ Restaurante":
     restaurante.exibir()
 
+
+# Carga/memória dos datasets (depois do módulo → inclui a carga desta página)
+painel_datasets()
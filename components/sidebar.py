@@ -1,4 +1,7 @@
 import streamlit as st
+from data_registry import get_dataset_registry
+from data_views import get_view_store
+from rag_tracing import TRACE_FILE, summary
 
 def sidebar_navigation():
     st.sidebar.title("📋 Navegação")
@@ -18,3 +21,36 @@ def sidebar_navigation():
         )
     )
     return menu
+
+
+def painel_metricas_rag():
+    """p50/p95 por etapa do RAG (spans do processo atual)."""
+    linhas = summary()
+    if not linhas:
+        return
+    with st.sidebar.expander("⏱️ Desempenho do RAG"):
+        st.dataframe(linhas, hide_index=True, use_container_width=True)
+        st.caption(f"Traces completos em `{TRACE_FILE}`")
+
+
+def painel_datasets():
+    """Tempo de carga e memória dos datasets já carregados no processo."""
+    registro  = get_dataset_registry()
+    linhas    = registro.stats()
+    consultas = registro.query_stats()
+    views     = get_view_store().stats()
+    if not linhas and not consultas["misses_consultas"] and not views:
+        return
+    with st.sidebar.expander("🗃️ Datasets em memória"):
+        if linhas:
+            st.dataframe(linhas, hide_index=True, use_container_width=True)
+            total = sum(l["memoria_MB"] for l in linhas)
+            st.caption(f"{total:.1f} MB compartilhados entre todas as sessões")
+        st.caption(
+            f"Consultas projetadas: {consultas['consultas_em_cache']} em cache · "
+            f"{consultas['taxa_consultas']:.0%} de hits"
+        )
+        if views:
+            st.dataframe(views, hide_index=True, use_container_width=True)
+            incrementais = sum(v["atualizacao"] == "incremental" for v in views)
+            st.caption(f"{len(views)} views materializadas · {incrementais} atualizadas por append")
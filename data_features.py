@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Iterable, Mapping, Sequence
+
+import pandas as pd
+
+# ═══════════ CONFIG ═══════════
+DIAS_SEMANA_PT = {
+    "Monday"   : "Segunda",
+    "Tuesday"  : "Terça",
+    "Wednesday": "Quarta",
+    "Thursday" : "Quinta",
+    "Friday"   : "Sexta",
+    "Saturday" : "Sábado",
+    "Sunday"   : "Domingo",
+}
+ORDEM_DIAS = list(DIAS_SEMANA_PT.values())
+
+
+# ═════ Colunas derivadas ═════
+@dataclass(frozen=True)
+class Feature:
+    """
+    Coluna calculada a partir de outras do mesmo dataset (vetorizada: recebe
+    o frame inteiro e devolve uma Series). Pode sobrescrever a coluna de
+    origem (tradução do ``Dia_Semana``).
+    """
+
+    name   : str
+    compute: Callable[[pd.DataFrame], pd.Series]
+
+
+def apply_features(df: pd.DataFrame, features: Iterable[Feature]) -> pd.DataFrame:
+    """Acrescenta as colunas em ordem (uma feature pode usar a anterior)."""
+    for feature in features:
+        df[feature.name] = feature.compute(df)
+    return df
+
+
+def feature_names(features: Sequence[Feature]) -> str:
+    return ",".join(feature.name for feature in features)
+
+
+# ───────── construtores usados em ``DATASETS``
+def month_of(column: str, name: str = "AnoMes") -> Feature:
+    """Ano-mês ("2024-05"); datas vazias ficam vazias (somem do groupby)."""
+    return Feature(name, lambda df: df[column].dt.strftime("%Y-%m").astype("category"))
+
+
+def year_of(column: str, name: str = "Ano") -> Feature:
+    return Feature(name, lambda df: df[column].dt.year.astype("Int16"))
+
+
+def days_between(end: str, start: str, name: str) -> Feature:
+    return Feature(name, lambda df: (df[end] - df[start]).dt.days)
+
+
+def months_between(end: str, start: str, name: str) -> Feature:
+    """Meses comerciais (30 dias), arredondados."""
+    return Feature(name, lambda df: ((df[end] - df[start]) / pd.Timedelta(days=30)).round())
+
+
+def days_until(column: str, name: str) -> Feature:
+    """Depende de hoje → usar em ``on_access`` (recalculada a cada leitura)."""
+    return Feature(name, lambda df: (df[column] - pd.Timestamp.today()).dt.days)
+
+
+def equals(column: str, value: object, name: str) -> Feature:
+    """Indicador booleano (base das taxas: SLA cumprido, inadimplência…)."""
+    return Feature(name, lambda df: df[column].eq(value))
+
+
+def translate(column: str, mapping: Mapping[str, str], order: Sequence[str]) -> Feature:
+    """Troca os rótulos e fixa a ordem de exibição (categoria ordenada)."""
+    return Feature(
+        column,
+        lambda df: pd.Categorical(
+            df[column].astype(str).replace(mapping), categories=list(order), ordered=True,
+        ),
+    )
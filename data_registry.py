@@ -0,0 +1,446 @@
+from __future__ import annotations
+
+import io
+import logging
+import operator
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_features import (
+    DIAS_SEMANA_PT, ORDEM_DIAS, Feature, apply_features, days_between, days_until, equals,
+    feature_names, month_of, months_between, translate, year_of,
+)
+
+logger = logging.getLogger(__name__)
+
+# ═══════════ CONFIG ═══════════
+DATA_FOLDER = Path("data")
+
+# CSV → Parquet tipado ao lado do original (``<nome>.typed.parquet``)
+PARQUET_SIDECARS   = os.getenv("DATASET_PARQUET_SIDECARS", "1") == "1"
+SIDECAR_SUFFIX     = ".typed.parquet"
+CATEGORY_MAX_RATIO = 0.5          # texto com ≤ 50% de valores distintos → category
+FINGERPRINT_KEY    = b"source_fingerprint"
+FEATURES_KEY       = b"derived_columns"
+SIDECAR_ROW_GROUP  = 64_000       # row groups menores → filtros pulam mais blocos
+
+QUERY_CACHE_SIZE = int(os.getenv("DATASET_QUERY_CACHE_SIZE", "64"))   # consultas em memória (LRU)
+
+# Filtro no formato do pyarrow: [("Status", "==", "Cancelada"), ("Ano", ">=", 2024)] (AND)
+Filters = Sequence[Tuple[str, str, Any]]
+
+
+# ═════ Especificação dos datasets ═════
+@dataclass(frozen=True)
+class DatasetSpec:
+    """
+    Arquivo de um módulo + opções de leitura (``parse_dates``, ``encoding``…).
+
+    CSVs são materializados uma vez num Parquet tipado (``sidecar``): datas
+    em datetime64, texto repetitivo como ``category`` e inteiros/floats no
+    menor tipo sem perda. O sidecar é refeito quando o CSV muda.
+
+    ``derived`` são colunas calculadas uma vez na carga (``AnoMes``, prazos,
+    rótulos traduzidos) e gravadas junto — no frame em cache e no sidecar
+    (Parquet com colunas derivadas também ganha sidecar). ``on_access``
+    depende do dia de hoje e é recalculada a cada ``load``.
+    """
+
+    name        : str
+    path        : Path
+    parse_dates : Tuple[str, ...]     = ()
+    read_options: Mapping[str, Any]   = field(default_factory=dict)
+    derived     : Tuple[Feature, ...] = ()
+    on_access   : Tuple[Feature, ...] = ()
+
+    @property
+    def format(self) -> str:
+        return "parquet" if self.path.suffix == ".parquet" else "csv"
+
+    @property
+    def sidecar(self) -> Path:
+        return self.path.with_suffix(SIDECAR_SUFFIX)
+
+    @property
+    def uses_sidecar(self) -> bool:
+        return PARQUET_SIDECARS and (self.format == "csv" or bool(self.derived))
+
+    def sidecar_fresh(self, fingerprint: Tuple[int, int]) -> bool:
+        """Sidecar do mesmo arquivo-fonte e com as mesmas colunas derivadas."""
+        meta = _sidecar_metadata(self.sidecar)
+        return (
+            meta.get(FINGERPRINT_KEY) == _fingerprint_bytes(fingerprint)
+            and meta.get(FEATURES_KEY, b"").decode() == feature_names(self.derived)
+        )
+
+    def read(self, fingerprint: Optional[Tuple[int, int]] = None) -> pd.DataFrame:
+        if self.format == "parquet" and not self.derived:
+            return pd.read_parquet(self.path, **self.read_options)
+        if not self.uses_sidecar or fingerprint is None:
+            return self.read_source()
+        if self.sidecar_fresh(fingerprint):
+            return pq.read_table(self.sidecar).to_pandas()
+        frame = self.read_source()
+        _write_sidecar(frame, self.sidecar, fingerprint, feature_names(self.derived))
+        return frame
+
+    def read_source(self) -> pd.DataFrame:
+        """Arquivo original, já com os tipos e as colunas derivadas do sidecar."""
+        if self.format == "parquet":
+            raw = pd.read_parquet(self.path, **self.read_options)
+        else:
+            raw = pd.read_csv(self.path, **self.read_options)
+        return apply_features(typed_frame(raw, self.parse_dates), self.derived)
+
+    def read_appended(self, offset: int) -> pd.DataFrame:
+        """Só as linhas gravadas depois de ``offset`` bytes (CSV que cresceu no fim)."""
+        with open(self.path, "rb") as fh:
+            header = fh.readline()
+            fh.seek(offset)
+            tail = fh.read()
+        raw = pd.read_csv(io.BytesIO(header + tail), **self.read_options)
+        return apply_features(typed_frame(raw, self.parse_dates), self.derived)
+
+
+# ═════ Tipagem + sidecar Parquet ═════
+def typed_frame(df: pd.DataFrame, date_columns: Tuple[str, ...] = ()) -> pd.DataFrame:
+    """Datas → datetime64, texto repetitivo → category, números → menor tipo exato."""
+    for col in df.columns:
+        series = df[col]
+        if col in date_columns:
+            df[col] = pd.to_datetime(series, errors="coerce")
+        elif series.dtype == object:
+            if series.nunique(dropna=True) <= CATEGORY_MAX_RATIO * len(series):
+                df[col] = series.astype("category")
+        elif pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            small = series.astype("float32")
+            if np.array_equal(small.to_numpy("float64"), series.to_numpy(), equal_nan=True):
+                df[col] = small                        # só quando não perde precisão
+    return df
+
+
+def _fingerprint_bytes(fingerprint: Tuple[int, int]) -> bytes:
+    return f"{fingerprint[0]}:{fingerprint[1]}".encode()
+
+
+def _sidecar_metadata(path: Path) -> Dict[bytes, bytes]:
+    """Metadados do sidecar (só lê o schema); vazio se não existe/corrompido."""
+    try:
+        return pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return {}
+
+
+def _write_sidecar(df: pd.DataFrame, path: Path, fingerprint: Tuple[int, int], features: str = "") -> None:
+    """Grava atômico; falha (disco somente leitura…) só desativa o atalho."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        FINGERPRINT_KEY: _fingerprint_bytes(fingerprint),
+        FEATURES_KEY   : features.encode(),
+    })
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        pq.write_table(table, tmp, row_group_size=SIDECAR_ROW_GROUP)
+        os.replace(tmp, path)
+    except OSError as exc:
+        tmp.unlink(missing_ok=True)
+        logger.warning("Sidecar Parquet não gravado (%s): %s", path, exc)
+
+
+_OPS = {
+    "==": operator.eq, "=": operator.eq, "!=": operator.ne,
+    "<" : operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+
+
+def _apply_filters(df: pd.DataFrame, filters: Optional[Filters]) -> pd.DataFrame:
+    """Mesmos filtros do pyarrow, em memória (fallback sem Parquet)."""
+    if not filters:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in filters:
+        if op == "in":
+            hit = df[col].isin(value)
+        elif op == "not in":
+            hit = ~df[col].isin(value)
+        else:
+            hit = _OPS[op](df[col], value)
+        mask &= hit.to_numpy(dtype=bool, na_value=False)
+    return df[mask]
+
+
+DATASETS: Dict[str, DatasetSpec] = {
+    spec.name: spec
+    for spec in (
+        DatasetSpec(
+            "atacado_contratos", DATA_FOLDER / "atacado" / "contratos_locacao_lojas.parquet",
+            parse_dates=("Data_Inicio", "Data_Fim"),
+            derived=(months_between("Data_Fim", "Data_Inicio", "Prazo_meses"),),
+        ),
+        DatasetSpec(
+            "atacado_expansao", DATA_FOLDER / "atacado" / "planos_expansao.csv",
+            parse_dates=("Data_Inauguracao_Prevista",),
+            derived=(year_of("Data_Inauguracao_Prevista"),),
+        ),
+        DatasetSpec(
+            "distribuicao", DATA_FOLDER / "distribuicao" / "contratos_distribuicao.csv",
+            parse_dates=("Data_Entrega",),
+            derived=(month_of("Data_Entrega"), equals("Cumprimento_SLA", "Sim", "SLA_Cumprido")),
+        ),
+        DatasetSpec(
+            "farmacia", DATA_FOLDER / "farmacia" / "fornecedores_medicamentos.csv",
+            parse_dates=("Data_Aprovacao_ANVISA", "Validade"),
+            derived=(days_between("Validade", "Data_Aprovacao_ANVISA", "Prazo_Aprovacao"),),
+            on_access=(days_until("Validade", "Dias_Para_Vencer"),),
+        ),
+        DatasetSpec(
+            "financeiro", DATA_FOLDER / "financeiro" / "contratos_credito.csv",
+            parse_dates=("Data_Contrato",),
+            derived=(month_of("Data_Contrato"),),
+        ),
+        DatasetSpec(
+            "logistica", DATA_FOLDER / "logistica" / "contratos_frete.csv",
+            parse_dates=("Data_Entrega",),
+            derived=(month_of("Data_Entrega"),),
+        ),
+        DatasetSpec(
+            "restaurante", DATA_FOLDER / "restaurante" / "restaurante.csv",
+            parse_dates=("Data",),
+            read_options={"encoding": "utf-8-sig"},
+            derived=(month_of("Data"), translate("Dia_Semana", DIAS_SEMANA_PT, ORDEM_DIAS)),
+        ),
+        DatasetSpec(
+            "supermercado", DATA_FOLDER / "supermercado" / "contratos_fornecedores_comida.parquet",
+            parse_dates=("Data_Assinatura",),
+            derived=(month_of("Data_Assinatura"),),
+        ),
+        DatasetSpec(
+            "turismo", DATA_FOLDER / "turismo" / "viagens.csv",
+            parse_dates=("Data_Reserva",),
+            derived=(month_of("Data_Reserva"),),
+        ),
+    )
+}
+
+
+# ═════ Cache do processo ═════
+@dataclass
+class _Loaded:
+    frame      : pd.DataFrame
+    fingerprint: Tuple[int, int]          # (mtime_ns, tamanho) do arquivo lido
+    load_s     : float
+    memory     : int
+    loads      : int = 1
+    hits       : int = 0
+
+
+class DatasetRegistry:
+    """
+    Cada dataset é lido uma vez por processo e compartilhado entre sessões.
+
+    • Invalida quando mtime ou tamanho do arquivo mudam (arquivo regravado).
+    • ``load`` devolve cópia rasa: colunas derivadas criadas pelo módulo
+      (``df["AnoMes"] = …``) não vazam para o frame compartilhado.
+    • Um lock por dataset → usuários simultâneos não leem o mesmo arquivo
+      em paralelo.
+    • ``query``/``aggregate`` leem só as colunas pedidas direto do Parquet
+      (original ou sidecar), com os filtros empurrados para o leitor —
+      row groups fora do filtro nem são lidos. Resultados em LRU.
+    """
+
+    def __init__(self, specs: Mapping[str, DatasetSpec] = DATASETS):
+        self.specs    = dict(specs)
+        self._lock    = threading.Lock()
+        self._locks   : Dict[str, threading.Lock] = {}
+        self._loaded  : Dict[str, _Loaded]        = {}
+        self._queries : "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+        self.query_hits   = 0
+        self.query_misses = 0
+
+    @staticmethod
+    def _fingerprint(path: Path) -> Tuple[int, int]:
+        stat = path.stat()                          # FileNotFoundError se sumiu
+        return stat.st_mtime_ns, stat.st_size
+
+    def _dataset_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def load(self, name: str) -> pd.DataFrame:
+        spec = self.specs[name]
+        with self._dataset_lock(name):
+            fingerprint = self._fingerprint(spec.path)
+            loaded      = self._loaded.get(name)
+            if loaded is not None and loaded.fingerprint == fingerprint:
+                loaded.hits += 1
+                return apply_features(loaded.frame.copy(deep=False), spec.on_access)
+
+            start = time.perf_counter()
+            frame = spec.read(fingerprint)
+            load_s = time.perf_counter() - start
+            self._loaded[name] = _Loaded(
+                frame       = frame,
+                fingerprint = fingerprint,
+                load_s      = load_s,
+                memory      = int(frame.memory_usage(deep=True).sum()),
+                loads       = loaded.loads + 1 if loaded else 1,
+                hits        = loaded.hits if loaded else 0,
+            )
+        logger.info("Dataset '%s' carregado em %.2fs (%d linhas).", name, load_s, len(frame))
+        return apply_features(frame.copy(deep=False), spec.on_access)
+
+    # ───────── consultas projetadas
+    def _parquet_source(self, name: str) -> Tuple[Optional[Path], Tuple[int, int]]:
+        """(Parquet consultável — original ou sidecar em dia —, fingerprint da fonte)."""
+        spec        = self.specs[name]
+        fingerprint = self._fingerprint(spec.path)
+        if spec.format == "parquet" and not spec.derived:
+            return spec.path, fingerprint
+        if not spec.uses_sidecar:
+            return None, fingerprint
+        with self._dataset_lock(name):
+            if not spec.sidecar_fresh(fingerprint):
+                spec.read(fingerprint)                         # (re)gera o sidecar
+            fresh = spec.sidecar_fresh(fingerprint)
+        return (spec.sidecar if fresh else None), fingerprint
+
+    def query(
+        self,
+        name   : str,
+        columns: Optional[Sequence[str]] = None,
+        filters: Optional[Filters]       = None,
+    ) -> pd.DataFrame:
+        """Só ``columns`` das linhas que passam em ``filters`` (lista AND do pyarrow)."""
+        path, fingerprint = self._parquet_source(name)
+        key = (name, fingerprint, tuple(columns) if columns else None, repr(filters))
+        with self._lock:
+            cached = self._queries.get(key)
+            if cached is not None:
+                self._queries.move_to_end(key)
+                self.query_hits += 1
+                return cached.copy(deep=False)
+
+        if path is not None:
+            frame = pq.read_table(
+                path, columns=list(columns) if columns else None, filters=filters or None,
+            ).to_pandas()
+        else:                                                  # sem sidecar → frame inteiro
+            frame = _apply_filters(self.load(name), filters)
+            frame = frame[list(columns)] if columns else frame
+
+        with self._lock:
+            self.query_misses += 1
+            self._queries[key] = frame
+            while len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+        return frame.copy(deep=False)
+
+    def aggregate(
+        self,
+        name   : str,
+        by     : Union[str, Sequence[str]],
+        value  : Optional[str]     = None,
+        agg    : str               = "size",
+        filters: Optional[Filters] = None,
+        label  : Optional[str]     = None,
+    ) -> pd.DataFrame:
+        """
+        Agregado pronto para plotar: ``by`` + coluna ``label`` (padrão:
+        ``value`` ou "Quantidade" para contagens). Lê só ``by`` e ``value``.
+        """
+        by      = [by] if isinstance(by, str) else list(by)
+        frame   = self.query(name, by + ([value] if value else []), filters)
+        grouped = frame.groupby(by, observed=True)
+        result  = grouped.size() if value is None else grouped[value].agg(agg)
+        return result.reset_index(name=label or value or "Quantidade")
+
+    def query_stats(self) -> Dict[str, Any]:
+        total = self.query_hits + self.query_misses
+        return {
+            "consultas_em_cache": len(self._queries),
+            "hits_consultas"    : self.query_hits,
+            "misses_consultas"  : self.query_misses,
+            "taxa_consultas"    : round(self.query_hits / total, 3) if total else 0.0,
+        }
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            if name is None:
+                self._loaded.clear()
+                self._queries.clear()
+            else:
+                self._loaded.pop(name, None)
+                for key in [k for k in self._queries if k[0] == name]:
+                    del self._queries[key]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Tempo de carga e memória por dataset já carregado no processo."""
+        with self._lock:
+            loaded_items = sorted(self._loaded.items())
+        return [
+            {
+                "dataset"   : name,
+                "linhas"    : len(loaded.frame),
+                "memoria_MB": round(loaded.memory / 1e6, 2),
+                "carga_s"   : round(loaded.load_s, 3),
+                "cargas"    : loaded.loads,
+                "hits"      : loaded.hits,
+            }
+            for name, loaded in loaded_items
+        ]
+
+
+_REGISTRY: DatasetRegistry | None = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_dataset_registry() -> DatasetRegistry:
+    """Registro único por processo."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = DatasetRegistry()
+        return _REGISTRY
+
+
+def load_dataset(name: str) -> pd.DataFrame:
+    """Atalho para os módulos: ``load_dataset("farmacia")``."""
+    return get_dataset_registry().load(name)
+
+
+def dataset_available(name: str) -> bool:
+    return DATASETS[name].path.exists()
+
+
+def query_dataset(
+    name   : str,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[Filters]       = None,
+) -> pd.DataFrame:
+    """Leitura projetada: ``query_dataset("logistica", ["UF_Destino", "Custo_Frete"])``."""
+    return get_dataset_registry().query(name, columns, filters)
+
+
+def aggregate_dataset(
+    name   : str,
+    by     : Union[str, Sequence[str]],
+    value  : Optional[str]     = None,
+    agg    : str               = "size",
+    filters: Optional[Filters] = None,
+    label  : Optional[str]     = None,
+) -> pd.DataFrame:
+    """``aggregate_dataset("logistica", "UF_Destino", "Tempo_Entrega_Dias", "mean")``."""
+    return get_dataset_registry().aggregate(name, by, value, agg, filters, label)
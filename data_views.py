@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_registry import DATA_FOLDER, DATASETS, _apply_filters, get_dataset_registry
+
+logger = logging.getLogger(__name__)
+
+# ═══════════ CONFIG ═══════════
+VIEWS_FOLDER  = DATA_FOLDER / "views"                 # estado parcial de cada view (Parquet)
+VIEW_META_KEY = b"view_state"
+DIGEST_CHUNK  = 1 << 20
+
+# Agregações recombináveis: o estado parcial do trecho novo soma-se ao antigo
+_PARTIALS = {
+    "size" : {"__n": "sum"},
+    "count": {"__n": "sum"},
+    "sum"  : {"__sum": "sum"},
+    "mean" : {"__sum": "sum", "__n": "sum"},
+    "rate" : {"__sum": "sum", "__n": "sum"},            # % de True numa coluna booleana
+    "min"  : {"__min": "min"},
+    "max"  : {"__max": "max"},
+}
+
+
+# ═════ Declaração ═════
+@dataclass(frozen=True)
+class AggregateView:
+    """
+    Agregado de um dataset declarado uma vez pelo módulo.
+
+    • ``by`` — chaves do groupby (colunas do dataset, inclusive as
+      derivadas na carga: ``AnoMes``, ``Ano``…).
+    • ``value``/``agg`` — coluna e agregação (``size`` conta linhas;
+      ``rate`` = % de linhas com ``value`` verdadeiro, ex. SLA cumprido).
+    • ``filters`` — mesma lista AND do pyarrow usada em ``query_dataset``;
+      ``required`` descarta linhas com essas colunas vazias.
+
+    O resultado já vem no formato de plot: ``by`` + coluna ``label``
+    (padrão: ``value`` ou "Quantidade").
+    """
+
+    dataset : str
+    name    : str
+    by      : Tuple[str, ...]
+    value   : Optional[str]                    = None
+    agg     : str                              = "size"
+    filters : Tuple[Tuple[str, str, Any], ...] = ()
+    required: Tuple[str, ...]                  = ()
+    label   : Optional[str]                    = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.dataset}.{self.name}"
+
+    @property
+    def output(self) -> str:
+        return self.label or self.value or "Quantidade"
+
+    @property
+    def incremental(self) -> bool:
+        return self.agg in _PARTIALS
+
+    @property
+    def signature(self) -> str:
+        """Muda quando a declaração muda → estado salvo deixa de valer."""
+        return hashlib.blake2b(repr(self).encode(), digest_size=8).hexdigest()
+
+    @property
+    def columns(self) -> List[str]:
+        cols = [*self.by, *self.required] + ([self.value] if self.value else [])
+        return list(dict.fromkeys(cols))
+
+    @property
+    def path(self) -> Path:
+        return VIEWS_FOLDER / self.dataset / f"{self.name}.parquet"
+
+    # ───────── estado parcial
+    def partial(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Estado recombinável (contagens/somas por chave) de um trecho do dataset."""
+        if self.required:
+            frame = frame.dropna(subset=list(self.required))
+        grouped = frame.groupby(list(self.by), observed=True)
+        if self.agg == "size":
+            state = grouped.size().to_frame("__n")
+        elif self.agg == "count":
+            state = grouped[self.value].count().to_frame("__n")
+        elif self.agg in ("mean", "rate"):
+            values = frame[self.value].astype("float64") if self.agg == "rate" else frame[self.value]
+            state  = values.groupby([frame[c] for c in self.by], observed=True).agg(["sum", "count"])
+            state  = state.set_axis(["__sum", "__n"], axis=1)
+        elif self.agg in _PARTIALS:
+            state = grouped[self.value].agg(self.agg).to_frame(next(iter(_PARTIALS[self.agg])))
+        else:                                                     # mediana, nunique… só recálculo
+            state = grouped[self.value].agg(self.agg).to_frame("__value")
+        state = state.reset_index()
+        for col in self.by:                                       # chaves comparáveis entre trechos
+            if isinstance(state[col].dtype, pd.CategoricalDtype):
+                state[col] = state[col].astype(object)
+        return state
+
+    def merge(self, old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+        return (
+            pd.concat([old, new], ignore_index=True)
+            .groupby(list(self.by), sort=False)
+            .agg(_PARTIALS[self.agg])
+            .reset_index()
+        )
+
+    def finalize(self, state: pd.DataFrame) -> pd.DataFrame:
+        keys = state[list(self.by)].copy()
+        if self.agg == "mean":
+            keys[self.output] = state["__sum"] / state["__n"]
+        elif self.agg == "rate":
+            keys[self.output] = 100 * state["__sum"] / state["__n"]
+        else:
+            keys[self.output] = state[[c for c in state.columns if c.startswith("__")][0]]
+        return keys.sort_values(list(self.by), ignore_index=True)
+
+
+# ═════ Assinatura do arquivo-fonte ═════
+def _digest(path: Path, limit: Optional[int] = None) -> str:
+    """blake2b dos primeiros ``limit`` bytes (arquivo todo se None)."""
+    h = hashlib.blake2b(digest_size=16)
+    remaining = limit if limit is not None else float("inf")
+    with open(path, "rb") as fh:
+        while remaining > 0:
+            chunk = fh.read(int(min(DIGEST_CHUNK, remaining)))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.hexdigest()
+
+
+def _ends_with_newline(path: Path, offset: int) -> bool:
+    with open(path, "rb") as fh:
+        fh.seek(offset - 1)
+        return fh.read(1) == b"\n"
+
+
+# ═════ Store ═════
+@dataclass
+class _Materialized:
+    state      : pd.DataFrame
+    frame      : pd.DataFrame
+    fingerprint: Tuple[int, int]
+    size       : int                     # bytes da fonte cobertos pelo estado
+    digest     : str                     # blake2b desses bytes
+    refresh    : str = "completo"        # completo | incremental | disco | intacto
+    hits       : int = 0
+
+
+class ViewStore:
+    """
+    Views materializadas: calculadas quando o dataset muda, servidas prontas
+    em todo rerun.
+
+    • Em memória por processo; estado parcial persistido em
+      ``data/views/<dataset>/<view>.parquet`` com fingerprint, tamanho e hash
+      da fonte → reinício do servidor não recalcula nada.
+    • CSV que só cresceu no fim (prefixo com o mesmo hash) → lê apenas as
+      linhas novas e recombina o estado (size/count/sum/mean/min/max).
+      Qualquer outra mudança, Parquet ou agregação não recombinável →
+      recálculo completo via ``query`` projetado.
+    """
+
+    def __init__(self):
+        self.views   : Dict[str, AggregateView]  = {}
+        self._lock   = threading.Lock()
+        self._locks  : Dict[str, threading.Lock] = {}
+        self._tables : Dict[str, _Materialized]  = {}
+
+    def declare(self, *views: AggregateView) -> Dict[str, AggregateView]:
+        with self._lock:
+            for view in views:
+                self.views[view.key] = view
+        return {view.name: view for view in views}
+
+    def _dataset_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def get(self, view: AggregateView) -> pd.DataFrame:
+        spec = DATASETS[view.dataset]
+        with self._dataset_lock(view.dataset):
+            stat        = spec.path.stat()                     # FileNotFoundError se sumiu
+            fingerprint = (stat.st_mtime_ns, stat.st_size)
+            table       = self._tables.get(view.key)
+            if table is None or table.fingerprint != fingerprint:
+                start = time.perf_counter()
+                hits  = table.hits if table else 0
+                table = self._refresh(view, table or self._read_disk(view), fingerprint)
+                table.hits = hits
+                self._tables[view.key] = table
+                if table.refresh != "disco":
+                    logger.info(
+                        "View '%s' (%s) em %.2fs (%d linhas).",
+                        view.key, table.refresh, time.perf_counter() - start, len(table.frame),
+                    )
+            table.hits += 1
+            return table.frame.copy(deep=False)
+
+    # ───────── atualização
+    def _refresh(
+        self,
+        view       : AggregateView,
+        previous   : Optional[_Materialized],
+        fingerprint: Tuple[int, int],
+    ) -> _Materialized:
+        spec = DATASETS[view.dataset]
+        size = fingerprint[1]
+        if previous is not None and previous.fingerprint == fingerprint:
+            previous.refresh = "disco"
+            return previous
+
+        if previous is not None and size >= previous.size and _digest(spec.path, previous.size) == previous.digest:
+            if size == previous.size:                          # só o mtime mudou
+                return self._save(view, previous.state, fingerprint, "intacto", previous.digest)
+            appendable = spec.format == "csv" and view.incremental
+            if appendable and _ends_with_newline(spec.path, previous.size):
+                appended = _apply_filters(spec.read_appended(previous.size), view.filters)
+                state    = view.merge(previous.state, view.partial(appended[view.columns]))
+                return self._save(view, state, fingerprint, "incremental")
+
+        frame = get_dataset_registry().query(view.dataset, view.columns, list(view.filters) or None)
+        return self._save(view, view.partial(frame), fingerprint, "completo")
+
+    def _save(
+        self,
+        view       : AggregateView,
+        state      : pd.DataFrame,
+        fingerprint: Tuple[int, int],
+        refresh    : str,
+        digest     : Optional[str] = None,
+    ) -> _Materialized:
+        spec  = DATASETS[view.dataset]
+        table = _Materialized(
+            state       = state,
+            frame       = view.finalize(state),
+            fingerprint = fingerprint,
+            size        = fingerprint[1],
+            digest      = digest or _digest(spec.path, fingerprint[1]),
+            refresh     = refresh,
+        )
+        meta  = f"{view.signature}|{fingerprint[0]}:{fingerprint[1]}|{table.digest}".encode()
+        arrow = pa.Table.from_pandas(state, preserve_index=False)
+        arrow = arrow.replace_schema_metadata({**(arrow.schema.metadata or {}), VIEW_META_KEY: meta})
+        view.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = view.path.with_name(view.path.name + ".tmp")
+        try:
+            pq.write_table(arrow, tmp)
+            os.replace(tmp, view.path)
+        except OSError as exc:
+            tmp.unlink(missing_ok=True)
+            logger.warning("View não persistida (%s): %s", view.path, exc)
+        return table
+
+    @staticmethod
+    def _read_disk(view: AggregateView) -> Optional[_Materialized]:
+        """Estado salvo por outro processo/execução (se a declaração não mudou)."""
+        try:
+            arrow = pq.read_table(view.path)
+        except (OSError, pa.ArrowInvalid):
+            return None
+        raw = (arrow.schema.metadata or {}).get(VIEW_META_KEY)
+        if not raw:
+            return None
+        signature, fingerprint, digest = raw.decode().split("|")
+        if signature != view.signature:
+            return None
+        mtime, size = (int(part) for part in fingerprint.split(":"))
+        state = arrow.to_pandas()
+        return _Materialized(
+            state       = state,
+            frame       = view.finalize(state),
+            fingerprint = (mtime, size),
+            size        = size,
+            digest      = digest,
+        )
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            tables = sorted(self._tables.items())
+        return [
+            {"view": key, "linhas": len(t.frame), "atualizacao": t.refresh, "hits": t.hits}
+            for key, t in tables
+        ]
+
+
+_STORE: ViewStore | None = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_view_store() -> ViewStore:
+    """Store único por processo."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ViewStore()
+        return _STORE
+
+
+def declare_views(*views: AggregateView) -> Dict[str, AggregateView]:
+    """No topo do módulo: ``VIEWS = declare_views(AggregateView(...), ...)``."""
+    return get_view_store().declare(*views)
+
+
+def materialized(view: AggregateView) -> pd.DataFrame:
+    """Agregado pronto da view (recalcula só se o dataset mudou)."""
+    return get_view_store().get(view)
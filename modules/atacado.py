@@ -6,23 +6,31 @@ import plotly.express as px
 # from langchain_community.vectorstores import FAISS
 # import os
 from pathlib import Path
+from data_registry import load_dataset
+from data_views import AggregateView, declare_views, materialized
 from rag_section import rag_section
 
+# Agregados dos gráficos (recalculados só quando os arquivos mudam)
+VIEWS = declare_views(
+    AggregateView("atacado_contratos", "lojas_estado", ("Estado",), label="Quantidade de Lojas"),
+    AggregateView("atacado_expansao", "inauguracoes_ano", ("Ano",)),
+)
+
 def exibir():
     st.title(" Módulo Atacado")
     st.markdown("Análise dos contratos de locação e planos de expansão de lojas do atacado.")
 
     # Carrega datasets
     try:
-        contratos = pd.read_parquet("data/atacado/contratos_locacao_lojas.parquet")
-        expansao = pd.read_csv("data/atacado/planos_expansao.csv", parse_dates=["Data_Inauguracao_Prevista"])
+        contratos = load_dataset("atacado_contratos")
+        expansao = load_dataset("atacado_expansao")
     except FileNotFoundError:
         st.error("Arquivos de dados não encontrados. Verifique se os arquivos estão na pasta `data/atacado`.")
         return
 
     # Gráfico 1: Mapa das lojas por estado
     st.subheader(" Mapa de distribuição das lojas por estado")
-    mapa = contratos.groupby("Estado").size().reset_index(name="Quantidade de Lojas")
+    mapa = materialized(VIEWS["lojas_estado"])
     fig_mapa = px.bar(
         mapa.sort_values("Quantidade de Lojas", ascending=True),
         x="Quantidade de Lojas",
@@ -64,9 +72,6 @@ def exibir():
 
     # Gráfico 4: Prazo de vigência dos contratos
     st.subheader(" Prazo de vigência dos contratos")
-    contratos["Data_Inicio"] = pd.to_datetime(contratos["Data_Inicio"])
-    contratos["Data_Fim"] = pd.to_datetime(contratos["Data_Fim"])
-    contratos["Prazo_meses"] = ((contratos["Data_Fim"] - contratos["Data_Inicio"]) / pd.Timedelta(days=30)).round()
     fig_prazo = px.histogram(
         contratos,
         x="Prazo_meses",
@@ -80,8 +85,7 @@ def exibir():
     with col1:
         # Gráfico 5: Histórico de inaugurações por ano
         st.subheader(" Histórico de inaugurações previstas")
-        expansao["Ano"] = expansao["Data_Inauguracao_Prevista"].dt.year
-        inauguracoes = expansao.groupby("Ano").size().reset_index(name="Quantidade")
+        inauguracoes = materialized(VIEWS["inauguracoes_ano"])
         fig_inauguracoes = px.line(
             inauguracoes,
             x="Ano",
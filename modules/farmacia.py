@@ -2,28 +2,38 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from pathlib import Path
+from data_registry import load_dataset
+from data_views import AggregateView, declare_views, materialized
 from rag_section import rag_section
 
+# Agregados dos gráficos (recalculados só quando o CSV muda)
+VIEWS = declare_views(
+    AggregateView("farmacia", "categorias", ("Categoria",)),
+    AggregateView("farmacia", "volume_fornecedor", ("Fornecedor",), "Volume_Entregue", "sum"),
+    AggregateView("farmacia", "preco_categoria", ("Categoria",), "Preco_Unitario", "mean"),
+    AggregateView("farmacia", "estados", ("Estado",)),
+    AggregateView("farmacia", "prazo_aprovacao", ("Categoria",), "Prazo_Aprovacao", "mean"),
+)
+
 def exibir():
     st.title("💊 Módulo Farmácia")
     st.markdown("Análise de fornecimento, controle de estoque e desempenho de medicamentos.")
 
     # Carregamento de dados
-    df = pd.read_csv("data/farmacia/fornecedores_medicamentos.csv", parse_dates=["Data_Aprovacao_ANVISA", "Validade"])
+    df = load_dataset("farmacia")
 
     # Gráfico 1 e 2 lado a lado
     col1, col2 = st.columns(2)
 
     with col1:
         st.subheader(" Quantidade de medicamentos por categoria")
-        cat_count = df["Categoria"].value_counts().reset_index()
-        cat_count.columns = ["Categoria", "Quantidade"]
+        cat_count = materialized(VIEWS["categorias"]).sort_values("Quantidade", ascending=False)
         fig1 = px.bar(cat_count, x="Categoria", y="Quantidade", color="Categoria", text="Quantidade")
         st.plotly_chart(fig1, use_container_width=True)
 
     with col2:
         st.subheader(" Fornecedores com maior volume de entrega")
-        fornecedor_vol = df.groupby("Fornecedor")["Volume_Entregue"].sum().reset_index()
+        fornecedor_vol = materialized(VIEWS["volume_fornecedor"])
         fig2 = px.bar(fornecedor_vol, x="Fornecedor", y="Volume_Entregue", color="Fornecedor", text="Volume_Entregue")
         st.plotly_chart(fig2, use_container_width=True)
 
@@ -32,7 +42,7 @@ def exibir():
 
     with col3:
         st.subheader(" Preço médio por categoria de medicamento")
-        preco_categoria = df.groupby("Categoria")["Preco_Unitario"].mean().reset_index()
+        preco_categoria = materialized(VIEWS["preco_categoria"])
         fig3 = px.line(preco_categoria, x="Categoria", y="Preco_Unitario", markers=True)
         st.plotly_chart(fig3, use_container_width=True)
 
@@ -44,8 +54,7 @@ def exibir():
 
     # Gráfico 5: Prazo médio de aprovação da ANVISA por categoria
     st.subheader(" Prazo médio de aprovação ANVISA por categoria")
-    df["Prazo_Aprovacao"] = (df["Validade"] - df["Data_Aprovacao_ANVISA"]).dt.days
-    prazo_aprov = df.groupby("Categoria")["Prazo_Aprovacao"].mean().reset_index()
+    prazo_aprov = materialized(VIEWS["prazo_aprovacao"])
     fig5 = px.bar(prazo_aprov, x="Categoria", y="Prazo_Aprovacao", color="Categoria", text="Prazo_Aprovacao")
     st.plotly_chart(fig5, use_container_width=True)
 
@@ -62,16 +71,15 @@ def exibir():
     with col1:
         # Gráfico 7: Média de dias até vencimento (análise de validade)
         st.subheader(" Dias até vencimento por categoria")
-        df["Dias_Para_Vencer"] = (df["Validade"] - pd.Timestamp.today()).dt.days
-        vencimento = df.groupby("Categoria")["Dias_Para_Vencer"].mean().reset_index()
+        # Dias_Para_Vencer depende de hoje: calculada a cada load_dataset, fora das views
+        vencimento = df.groupby("Categoria", observed=True)["Dias_Para_Vencer"].mean().reset_index()
         fig7 = px.bar(vencimento, x="Categoria", y="Dias_Para_Vencer", color="Categoria", text="Dias_Para_Vencer")
         st.plotly_chart(fig7, use_container_width=True)
 
     with col2:
         # Gráfico 8: Distribuição geográfica por estado
         st.subheader(" Distribuição de medicamentos por estado")
-        estado_dist = df["Estado"].value_counts().reset_index()
-        estado_dist.columns = ["Estado", "Quantidade"]
+        estado_dist = materialized(VIEWS["estados"])
         fig8 = px.pie(estado_dist, names="Estado", values="Quantidade", hole=0.4)
         st.plotly_chart(fig8, use_container_width=True)
 
@@ -2,43 +2,39 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from pathlib import Path
+from data_features import ORDEM_DIAS
+from data_views import AggregateView, declare_views, materialized
 from rag_section import rag_section
 
+# Agregados dos gráficos (recalculados só quando o CSV muda)
+VIEWS = declare_views(
+    AggregateView("restaurante", "pratos_dia", ("Dia_Semana", "Prato"), "Qtd_Refeicoes_Servidas", "sum"),
+    AggregateView("restaurante", "custo_prato", ("Prato",), "Custo_Total_Prato", "mean"),
+    AggregateView("restaurante", "fornecedores", ("Fornecedor",), label="Qtd_Contratos"),
+    AggregateView("restaurante", "refeicoes_mes", ("AnoMes",), "Qtd_Refeicoes_Servidas", "sum"),
+    AggregateView("restaurante", "arrecadacao_servico", ("Tipo_Servico",), "Valor_Total_Arrecadado", "sum"),
+    AggregateView("restaurante", "refeicoes_turno", ("Turno",), "Qtd_Refeicoes_Servidas", "sum"),
+)
+
 def exibir():
     st.title("🍽️ Módulo Restaurante")
     st.markdown("Análises de consumo no restaurante.")
 
-    # Carregar dados
-    df = pd.read_csv("data/restaurante/restaurante.csv", encoding="utf-8-sig")
-    df["Data"] = pd.to_datetime(df["Data"])
-    df["AnoMes"] = df["Data"].dt.to_period("M").astype(str)
-
-    # Traduzir dias da semana para português
-    dias_semana_pt = {
-        "Monday": "Segunda",
-        "Tuesday": "Terça",
-        "Wednesday": "Quarta",
-        "Thursday": "Quinta",
-        "Friday": "Sexta",
-        "Saturday": "Sábado",
-        "Sunday": "Domingo"
-    }
-    df["Dia_Semana"] = df["Dia_Semana"].replace(dias_semana_pt)
-    ordem_dias = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
-    df["Dia_Semana"] = pd.Categorical(df["Dia_Semana"], categories=ordem_dias, ordered=True)
-
     # 🍽️ Gráfico 1: Pratos mais vendidos por dia da semana
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("🍽️ Pratos mais vendidos por dia da semana")
-        top_pratos = df.groupby(["Dia_Semana", "Prato"], observed=False)["Qtd_Refeicoes_Servidas"].sum().reset_index()
+        top_pratos = materialized(VIEWS["pratos_dia"])
+        # Dia_Semana já vem traduzido da carga; a view devolve texto → reaplica a ordem
+        top_pratos["Dia_Semana"] = pd.Categorical(top_pratos["Dia_Semana"], categories=ORDEM_DIAS, ordered=True)
+        top_pratos = top_pratos.sort_values(["Dia_Semana", "Prato"])
         fig1 = px.bar(top_pratos, x="Dia_Semana", y="Qtd_Refeicoes_Servidas", color="Prato", barmode="stack")
         st.plotly_chart(fig1, use_container_width=True)
 
     # 📊 Gráfico 2: Custo médio por prato
     with col2:
         st.subheader("📊 Custo médio por prato")
-        custo_prato = df.groupby("Prato")["Custo_Total_Prato"].mean().reset_index()
+        custo_prato = materialized(VIEWS["custo_prato"])
         fig2 = px.bar(custo_prato, x="Prato", y="Custo_Total_Prato", labels={"Custo_Total_Prato": "Custo Médio (R$)"})
         st.plotly_chart(fig2, use_container_width=True)
 
@@ -46,15 +42,14 @@ def exibir():
     col3, col4 = st.columns(2)
     with col3:
         st.subheader("🧾 Fornecimentos por fornecedor")
-        contratos = df["Fornecedor"].value_counts().reset_index()
-        contratos.columns = ["Fornecedor", "Qtd_Contratos"]
+        contratos = materialized(VIEWS["fornecedores"])
         fig3 = px.pie(contratos, values="Qtd_Contratos", names="Fornecedor", title="Distribuição por Fornecedor")
         st.plotly_chart(fig3, use_container_width=True)
 
     # 📈 Gráfico 4: Evolução de refeições por mês
     with col4:
         st.subheader("📈 Evolução de refeições por mês")
-        evolucao = df.groupby("AnoMes")["Qtd_Refeicoes_Servidas"].sum().reset_index()
+        evolucao = materialized(VIEWS["refeicoes_mes"])
         fig4 = px.line(evolucao, x="AnoMes", y="Qtd_Refeicoes_Servidas", markers=True)
         st.plotly_chart(fig4, use_container_width=True)
 
@@ -62,14 +57,14 @@ def exibir():
     col5, col6 = st.columns(2)
     with col5:
         st.subheader("🍽️ Arrecadação por tipo de serviço")
-        comparativo = df.groupby("Tipo_Servico")["Valor_Total_Arrecadado"].sum().reset_index()
+        comparativo = materialized(VIEWS["arrecadacao_servico"])
         fig5 = px.bar(comparativo, x="Tipo_Servico", y="Valor_Total_Arrecadado", color="Tipo_Servico")
         st.plotly_chart(fig5, use_container_width=True)
 
     # 🕐 Gráfico 6: Refeições por turno
     with col6:
         st.subheader("🕐 Distribuição de refeições por turno")
-        turnos = df.groupby("Turno")["Qtd_Refeicoes_Servidas"].sum().reset_index()
+        turnos = materialized(VIEWS["refeicoes_turno"])
         fig6 = px.pie(turnos, values="Qtd_Refeicoes_Servidas", names="Turno", title="Refeições por Turno")
         st.plotly_chart(fig6, use_container_width=True)
 
@@ -2,22 +2,33 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 from pathlib import Path
+from data_registry import load_dataset
+from data_views import AggregateView, declare_views, materialized
 from rag_section import rag_section
 
+# Agregados dos gráficos (recalculados só quando o CSV muda)
+VIEWS = declare_views(
+    AggregateView("financeiro", "contratos_estado", ("Estado",)),
+    AggregateView("financeiro", "valor_tipo", ("Tipo_Credito",), "Valor_Contratado", "sum"),
+    AggregateView(
+        "financeiro", "inadimplentes_mes", ("AnoMes",), label="Inadimplentes",
+        filters=(("Inadimplente", "==", True),),
+    ),
+)
+
 def exibir():
     st.title("💳 Módulo Serviços Financeiros")
     st.markdown("Análise dos contratos de crédito e comportamento financeiro dos clientes.")
 
     # Carrega o dataset
-    df = pd.read_csv("data/financeiro/contratos_credito.csv", parse_dates=["Data_Contrato"])
+    df = load_dataset("financeiro")
 
     col1, col2 = st.columns(2)
 
     # Gráfico 1: Número de contratos por estado
     with col1:
         st.subheader(" Contratos ativos por estado")
-        estado_counts = df['Estado'].value_counts().reset_index()
-        estado_counts.columns = ['Estado', 'Quantidade']
+        estado_counts = materialized(VIEWS["contratos_estado"]).sort_values("Quantidade", ascending=False)
         fig1 = px.bar(estado_counts, x='Estado', y='Quantidade', color='Estado')
         st.plotly_chart(fig1, use_container_width=True)
 
@@ -29,14 +40,13 @@ def exibir():
 
     # Gráfico 3: Valor total contratado por tipo de crédito
     st.subheader(" Valor contratado por tipo de crédito")
-    tipo_valor = df.groupby("Tipo_Credito")["Valor_Contratado"].sum().reset_index()
+    tipo_valor = materialized(VIEWS["valor_tipo"])
     fig3 = px.pie(tipo_valor, names="Tipo_Credito", values="Valor_Contratado", hole=0.4)
     st.plotly_chart(fig3, use_container_width=True)
 
     # Gráfico 4: Inadimplemento ao longo do tempo
     st.subheader(" Evolução do inadimplemento")
-    df["AnoMes"] = df["Data_Contrato"].dt.to_period("M").astype(str)
-    inad_mensal = df[df["Inadimplente"] == True].groupby("AnoMes").size().reset_index(name="Inadimplentes")
+    inad_mensal = materialized(VIEWS["inadimplentes_mes"])
     fig4 = px.line(inad_mensal, x="AnoMes", y="Inadimplentes", markers=True)
     st.plotly_chart(fig4, use_container_width=True)
 
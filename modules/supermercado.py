@@ -2,16 +2,24 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from pathlib import Path
+from data_registry import dataset_available, query_dataset
+from data_views import AggregateView, declare_views, materialized
 from rag_section import rag_section
 
+# Agregados dos gráficos (recalculados só quando o Parquet muda)
+VIEWS = declare_views(
+    AggregateView("supermercado", "valor_fornecedor", ("Fornecedor",), "Valor_Contrato", "sum"),
+    AggregateView("supermercado", "tipo_contrato", ("Fornecedor", "Tipo_Contrato")),
+    AggregateView("supermercado", "valor_mes", ("AnoMes",), "Valor_Contrato", "sum"),
+    AggregateView("supermercado", "valor_categoria", ("Categoria",), "Valor_Contrato", "sum"),
+)
+
 def exibir():
     st.title("🛒 Módulo Supermercado")
     st.markdown("Análise de contratos com fornecedores de comida")
 
-    # Carrega o dataset
-    try:
-        df = pd.read_parquet("data/supermercado/contratos_fornecedores_comida.parquet")
-    except FileNotFoundError:
+    # Cada gráfico lê só as colunas que usa (Parquet projetado)
+    if not dataset_available("supermercado"):
         st.error("Arquivo de dados não encontrado. Verifique se o arquivo está na pasta `data`.")
         return
 
@@ -20,19 +28,19 @@ def exibir():
 
     with col1:
         st.subheader(" Top 10 fornecedores por valor contratado")
-        top_fornecedores = df.groupby("Fornecedor")["Valor_Contrato"].sum().nlargest(10).reset_index()
+        top_fornecedores = materialized(VIEWS["valor_fornecedor"]).nlargest(10, "Valor_Contrato")
         fig1 = px.bar(top_fornecedores, x="Fornecedor", y="Valor_Contrato", title="Top 10 Fornecedores")
         fig1.update_layout(xaxis_tickangle=-45)  # Gira os rótulos
         st.plotly_chart(fig1, use_container_width=True)
 
     with col2:
         st.subheader(" Distribuição dos prazos de validade exigidos")
-        fig2 = px.histogram(df, x="Prazo_Validade_Dias", nbins=10, title="Distribuição dos Prazos de Validade")
+        fig2 = px.histogram(query_dataset("supermercado", ["Prazo_Validade_Dias"]), x="Prazo_Validade_Dias", nbins=10, title="Distribuição dos Prazos de Validade")
         st.plotly_chart(fig2, use_container_width=True)
 
     # Tipos de contrato por fornecedor
     st.subheader(" Tipos de contratos por fornecedor")
-    tipo_contrato = df.groupby(["Fornecedor", "Tipo_Contrato"]).size().reset_index(name="Quantidade")
+    tipo_contrato = materialized(VIEWS["tipo_contrato"])
     fig3 = px.bar(tipo_contrato, x="Fornecedor", y="Quantidade", color="Tipo_Contrato", barmode="group")
     st.plotly_chart(fig3, use_container_width=True)
 
@@ -41,16 +49,14 @@ def exibir():
     with col1:
         # Evolução dos contratos por mês
         st.subheader(" Evolução dos contratos assinados por mês")
-        df["Data_Assinatura"] = pd.to_datetime(df["Data_Assinatura"])
-        df["AnoMes"] = df["Data_Assinatura"].dt.to_period("M").astype(str)
-        contratos_por_mes = df.groupby("AnoMes")["Valor_Contrato"].sum().reset_index()
+        contratos_por_mes = materialized(VIEWS["valor_mes"])
         fig4 = px.line(contratos_por_mes, x="AnoMes", y="Valor_Contrato", markers=True)
         st.plotly_chart(fig4, use_container_width=True)
     
     with col2:
         # Comparativo de valores por categoria
         st.subheader(" Comparativo de valores contratados por categoria")
-        categoria_valores = df.groupby("Categoria")["Valor_Contrato"].sum().reset_index()
+        categoria_valores = materialized(VIEWS["valor_categoria"])
         fig5 = px.pie(categoria_valores, values="Valor_Contrato", names="Categoria", title="Distribuição por Categoria")
         st.plotly_chart(fig5, use_container_width=True)
 
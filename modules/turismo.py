@@ -3,35 +3,37 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from pathlib import Path
+from data_views import AggregateView, declare_views, materialized
 from rag_section import rag_section
 
+# Agregados dos gráficos (recalculados só quando o CSV muda)
+_EFETIVADA = (("Status", "==", "Efetivada"),)
+_CANCELADA = (("Status", "==", "Cancelada"),)
+VIEWS = declare_views(
+    AggregateView("turismo", "destinos", ("Destino",), filters=_EFETIVADA, label="Reservas"),
+    AggregateView("turismo", "cancelamentos", ("Fornecedor",), filters=_CANCELADA, label="Cancelamentos"),
+    AggregateView("turismo", "reembolso_servico", ("Tipo_Servico",), "Valor_Reembolso", "mean", filters=_CANCELADA),
+    AggregateView("turismo", "reservas_mes_servico", ("AnoMes", "Tipo_Servico"), label="Reservas"),
+    AggregateView("turismo", "motivos", ("Motivo_Cancelamento",), filters=_CANCELADA, label="Ocorrências"),
+)
+
 def exibir():
     st.title("✈️ Módulo Turismo")
     st.markdown("Análise das viagens e reservas.")
 
-    # Carregar dados
-    df = pd.read_csv("data/turismo/viagens.csv")
-
-    # Forçar conversão correta para datetime
-    df["Data_Reserva"] = pd.to_datetime(df["Data_Reserva"], errors="coerce")
-
-
-
     col1, col2 = st.columns(2)
 
     with col1:
         # 🌍 Top destinos mais vendidos
         st.subheader(" Destinos mais visitados")
-        destinos = df[df["Status"] == "Efetivada"]["Destino"].value_counts().reset_index()
-        destinos.columns = ["Destino", "Reservas"]
+        destinos = materialized(VIEWS["destinos"]).sort_values("Reservas", ascending=False)
         fig1 = px.bar(destinos, x="Destino", y="Reservas", color="Destino", text="Reservas")
         st.plotly_chart(fig1, use_container_width=True)
 
     with col2:
         # 📊 Taxa de cancelamento por fornecedor
         st.subheader(" Cancelamentos por fornecedor")
-        cancelamentos = df[df["Status"] == "Cancelada"]["Fornecedor"].value_counts().reset_index()
-        cancelamentos.columns = ["Fornecedor", "Cancelamentos"]
+        cancelamentos = materialized(VIEWS["cancelamentos"])
         fig2 = px.pie(cancelamentos, names="Fornecedor", values="Cancelamentos", hole=0.4)
         st.plotly_chart(fig2, use_container_width=True)
 
@@ -40,15 +42,14 @@ def exibir():
     with col3:
         # 🧾 Média de reembolso por tipo de serviço
         st.subheader(" Reembolso médio por tipo de serviço")
-        media_reembolso = df[df["Status"] == "Cancelada"].groupby("Tipo_Servico")["Valor_Reembolso"].mean().reset_index()
+        media_reembolso = materialized(VIEWS["reembolso_servico"])
         fig3 = px.bar(media_reembolso, x="Tipo_Servico", y="Valor_Reembolso", color="Tipo_Servico", text_auto=".2s")
         st.plotly_chart(fig3, use_container_width=True)
 
     with col4:
         # 📈 Evolução de reservas por tipo de serviço (mês a mês)
         st.subheader("📈 Evolução de reservas por tipo de serviço (mês a mês)")
-        df["AnoMes"] = pd.to_datetime(df["Data_Reserva"]).dt.to_period("M").astype(str)
-        evolucao_servico = df.groupby(["AnoMes", "Tipo_Servico"]).size().reset_index(name="Reservas")
+        evolucao_servico = materialized(VIEWS["reservas_mes_servico"])
         fig5 = px.line(
             evolucao_servico,
             x="AnoMes",
@@ -62,8 +63,11 @@ def exibir():
 
     # 💬 Motivos de cancelamento mais recorrentes
     st.subheader(" Motivos de cancelamento mais recorrentes")
-    motivos = df[df["Status"] == "Cancelada"]["Motivo_Cancelamento"].value_counts().reset_index()
-    motivos.columns = ["Motivo", "Ocorrências"]
+    motivos = (
+        materialized(VIEWS["motivos"])
+        .rename(columns={"Motivo_Cancelamento": "Motivo"})
+        .sort_values("Ocorrências", ascending=False)
+    )
     fig5 = px.bar(motivos, x="Motivo", y="Ocorrências", color="Motivo", text="Ocorrências")
     st.plotly_chart(fig5, use_container_width=True)
 
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document as LCDocument
+
+# ═══════════ CONFIG ═══════════
+# Cache semântico DESLIGADO por padrão: no E5 perguntas que só diferem no nº
+# do contrato, na parte ou na data passam fácil de 0.95 de cosseno. Ligado,
+# só serve se a pergunta nova recuperou exatamente os mesmos chunks e o
+# cosseno (embeddings "query: ") for ≥ o limiar.
+SEMANTIC_CACHE_ENABLED     = os.getenv("RAG_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD   = float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.98"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("RAG_SEMANTIC_CACHE_MAX_ENTRIES", "256"))   # por índice
+
+ANSWER_CACHE_FOLDER      = Path("data") / "cache"
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("RAG_ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+# ═════ Cache semântico de respostas ═════
+class _IndexAnswers:
+    """Respostas de um índice numa geração específica (LRU)."""
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        # chave → (embedding da pergunta, IDs dos chunks do contexto, resposta)
+        self.entries: "OrderedDict[int, Tuple[np.ndarray, Tuple[str, ...], str]]" = OrderedDict()
+        self.next_key   = 0
+
+
+class SemanticAnswerCache:
+    """
+    Respostas por índice, reaproveitadas para perguntas semanticamente iguais.
+
+    • Consultado DEPOIS da busca: hit só entre entradas com os mesmos chunks
+      recuperados e cosseno entre as perguntas ≥ ``threshold`` — pergunta
+      sobre outro contrato recupera outros chunks e nunca herda a resposta.
+    • ``enabled=False`` (padrão, ``RAG_SEMANTIC_CACHE``) → nunca guarda nem serve.
+    • Cada índice guarda a ``generation`` do ``SegmentedFAISS``: mudou
+      (chunks adicionados/compactados) → as respostas antigas são descartadas.
+    • LRU com ``max_entries`` por índice; em memória, compartilhado no processo.
+    """
+
+    def __init__(
+        self,
+        threshold  : float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int   = SEMANTIC_CACHE_MAX_ENTRIES,
+        enabled    : bool  = SEMANTIC_CACHE_ENABLED,
+    ):
+        self.enabled     = enabled
+        self.threshold   = threshold
+        self.max_entries = max_entries
+        self._indexes: Dict[str, _IndexAnswers] = {}
+        self._lock       = threading.Lock()
+        self.hits        = 0
+        self.misses      = 0
+
+    @staticmethod
+    def _normalized(vector: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype="float32")
+        return v / (np.linalg.norm(v) or 1.0)
+
+    def _current(self, index_key: str, generation: int) -> _IndexAnswers:
+        answers = self._indexes.get(index_key)
+        if answers is None or answers.generation != generation:
+            answers = self._indexes[index_key] = _IndexAnswers(generation)
+        return answers
+
+    @staticmethod
+    def _chunk_ids(context: Sequence[LCDocument]) -> Tuple[str, ...]:
+        return tuple(sorted(_doc_key(d) for d in context))
+
+    def lookup(
+        self,
+        index_key : str,
+        generation: int,
+        vector    : Sequence[float],
+        context   : Sequence[LCDocument],
+    ) -> Optional[str]:
+        """Resposta de uma pergunta próxima que recuperou os mesmos chunks."""
+        if not self.enabled or not context:
+            return None
+        query = self._normalized(vector)
+        ids   = self._chunk_ids(context)
+        with self._lock:
+            answers = self._current(index_key, generation)
+            keys    = [k for k, entry in answers.entries.items() if entry[1] == ids]
+            if keys:
+                scores = np.stack([answers.entries[k][0] for k in keys]) @ query
+                best   = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    answers.entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return answers.entries[keys[best]][2]
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        index_key : str,
+        generation: int,
+        vector    : Sequence[float],
+        answer    : str,
+        context   : List[LCDocument],
+    ) -> None:
+        if not self.enabled or not answer or not context:
+            return
+        with self._lock:
+            answers = self._current(index_key, generation)
+            answers.entries[answers.next_key] = (
+                self._normalized(vector), self._chunk_ids(context), answer,
+            )
+            answers.next_key += 1
+            while len(answers.entries) > self.max_entries:
+                answers.entries.popitem(last=False)
+
+    def invalidate(self, index_key: str) -> None:
+        with self._lock:
+            self._indexes.pop(index_key, None)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        with self._lock:
+            size = sum(len(a.entries) for a in self._indexes.values())
+        return {
+            "semantico_ativo"      : self.enabled,
+            "respostas_semanticas" : size,
+            "hits_semanticos"      : self.hits,
+            "misses_semanticos"    : self.misses,
+            "taxa_semantica"       : round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+_SEMANTIC: SemanticAnswerCache | None = None
+_SEMANTIC_LOCK = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticAnswerCache:
+    """Cache semântico único por processo."""
+    global _SEMANTIC
+    with _SEMANTIC_LOCK:
+        if _SEMANTIC is None:
+            _SEMANTIC = SemanticAnswerCache()
+        return _SEMANTIC
+
+
+# ═════ Cache exato em disco ═════
+def normalize_question(question: str) -> str:
+    """Minúsculas + espaços colapsados (``"  Multa? "`` == ``"multa?"``)."""
+    return re.sub(r"\s+", " ", question).strip().casefold()
+
+
+def _doc_key(doc: LCDocument) -> str:
+    return doc.id or hashlib.md5(doc.page_content.encode()).hexdigest()
+
+
+class ExactAnswerCache:
+    """
+    Respostas persistentes na frente da chamada ao LLM.
+
+    Chave = sha256(pergunta normalizada, IDs ordenados dos chunks do contexto,
+    modelo, hash do template) → mesma recuperação nunca paga geração duas
+    vezes, mesmo após reiniciar o servidor.
+
+    • Entradas expiram após ``ttl`` segundos.
+    • Passou de ``max_entries`` → remove as menos usadas recentemente (LRU).
+    """
+
+    def __init__(
+        self,
+        folder     : Path = ANSWER_CACHE_FOLDER,
+        ttl        : int  = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int  = ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        folder.mkdir(parents=True, exist_ok=True)
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self._lock       = threading.Lock()
+
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+        self._db = sqlite3.connect(
+            folder / "answers.sqlite", check_same_thread=False, isolation_level=None,
+        )
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS answers (
+                key        TEXT PRIMARY KEY,
+                answer     TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used  REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS answers_lru ON answers(last_used);
+            """
+        )
+
+    @staticmethod
+    def key(
+        question: str, context: Sequence[LCDocument], model: str, template: str,
+    ) -> str:
+        payload = json.dumps(
+            [
+                normalize_question(question),
+                sorted(_doc_key(d) for d in context),
+                model,
+                hashlib.sha256(template.encode()).hexdigest(),
+            ]
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT answer, created_at FROM answers WHERE key = ?", (key,),
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, answer: str) -> None:
+        if not answer:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)",
+                    (key, answer, now, now),
+                )
+                expired = self._db.execute(
+                    "DELETE FROM answers WHERE created_at < ?", (now - self.ttl,),
+                ).rowcount
+                excess = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    self._db.execute(
+                        "DELETE FROM answers WHERE key IN "
+                        "(SELECT key FROM answers ORDER BY last_used LIMIT ?)",
+                        (excess,),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self.evictions += expired + max(excess, 0)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {
+            "respostas_em_disco" : size,
+            "hits_exatos"        : self.hits,
+            "misses_exatos"      : self.misses,
+            "taxa_exata"         : round(self.hits / total, 3) if total else 0.0,
+            "evictions_exatas"   : self.evictions,
+        }
+
+
+_EXACT: ExactAnswerCache | None = None
+_EXACT_LOCK = threading.Lock()
+
+
+def get_exact_cache() -> ExactAnswerCache:
+    """Cache exato único por processo (arquivo em ``data/cache``)."""
+    global _EXACT
+    with _EXACT_LOCK:
+        if _EXACT is None:
+            _EXACT = ExactAnswerCache()
+        return _EXACT
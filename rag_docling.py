@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from docling.chunking import HybridChunker
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.document import ConversionResult
+from docling.document_converter import DocumentConverter
+
+from rag_tracing import span
+
+# ═══════════ CONFIG ═══════════
+# Nº de conversores mantidos vivos no processo (cada um carrega os modelos
+# de layout/tabela; 1 é suficiente para a maioria dos servidores).
+DOCLING_POOL_SIZE = int(os.getenv("DOCLING_POOL_SIZE", "1"))
+
+# Páginas por conversão em ``convert_windows`` (progresso por janela; 0 = tudo de uma vez)
+DOCLING_PAGE_WINDOW = int(os.getenv("DOCLING_PAGE_WINDOW", "10"))
+
+
+def page_count(source: str) -> Optional[int]:
+    """Nº de páginas do PDF via pypdfium2 (dependência do Docling); ``None`` se ilegível."""
+    try:
+        import pypdfium2
+
+        pdf = pypdfium2.PdfDocument(source)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    except Exception:
+        return None
+
+
+# ═════ Pool de conversores ═════
+class DoclingConverterPool:
+    """
+    Conversores Docling de longa duração, compartilhados por todos os módulos.
+
+    • Os modelos são carregados uma única vez (``warm_up`` ou primeiro uso).
+    • Cada conversão pega um conversor livre do pool → seguro entre threads.
+    • Tempo de carga dos modelos e tempo por página são medidos separadamente.
+
+    Implementa ``convert(source, **kw)`` → pode ser passado como ``converter``
+    do ``DoclingLoader``.
+    """
+
+    def __init__(self, size: int = DOCLING_POOL_SIZE):
+        self._size      = max(1, size)
+        self._created   = 0
+        self._idle: "queue.Queue[DocumentConverter]" = queue.Queue()
+        self._lock      = threading.Lock()
+        self._chunker: HybridChunker | None = None
+
+        self.model_load_seconds = 0.0
+        self.pages_converted    = 0
+        self.convert_seconds    = 0.0
+        self.documents          = 0
+
+    # ───────── criação / aquecimento
+    def _new_converter(self) -> DocumentConverter:
+        with span("docling.load_models") as current:
+            converter = DocumentConverter()
+            converter.initialize_pipeline(InputFormat.PDF)  # carrega os modelos agora
+        self.model_load_seconds += current.duration
+        return converter
+
+    def _acquire(self) -> DocumentConverter:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self._size:
+                self._created += 1
+                return self._new_converter()
+        return self._idle.get()                             # espera um livre
+
+    def warm_up(self) -> None:
+        """Garante ao menos um conversor (e o chunker) carregado."""
+        self._idle.put(self._acquire())
+        _ = self.chunker
+
+    @property
+    def chunker(self) -> HybridChunker:
+        with self._lock:
+            if self._chunker is None:
+                self._chunker = HybridChunker()
+            return self._chunker
+
+    # ───────── conversão
+    def convert(self, source: str, **kwargs: Any) -> ConversionResult:
+        with span("docling.convert") as current:
+            converter = self._acquire()
+            try:
+                start  = time.perf_counter()
+                result = converter.convert(source=source, **kwargs)
+                duration = time.perf_counter() - start
+            finally:
+                self._idle.put(converter)
+
+            pages = len(result.pages) or 1
+            current.set(pages=pages)
+        with self._lock:
+            self.documents       += 1
+            self.pages_converted += pages
+            self.convert_seconds += duration
+        return result
+
+    def convert_windows(
+        self, source: str, window: int = DOCLING_PAGE_WINDOW,
+    ) -> Iterator[Tuple[ConversionResult, int, int]]:
+        """
+        Converte em janelas de ``window`` páginas → (resultado, páginas feitas, total).
+
+        Sem contagem de páginas (não-PDF) ou ``window <= 0`` → uma conversão só.
+        """
+        total = page_count(source) if window > 0 else None
+        if not total:
+            result = self.convert(source)
+            pages  = len(result.pages)
+            yield result, pages, pages
+            return
+        for first in range(1, total + 1, window):
+            last = min(first + window - 1, total)
+            yield self.convert(source, page_range=(first, last)), last, total
+
+    def stats(self) -> Dict[str, float]:
+        """Métricas acumuladas do processo."""
+        per_page = self.convert_seconds / self.pages_converted if self.pages_converted else 0.0
+        return {
+            "conversores"         : self._created,
+            "carga_modelos_s"     : round(self.model_load_seconds, 2),
+            "documentos"          : self.documents,
+            "paginas"             : self.pages_converted,
+            "conversao_s"         : round(self.convert_seconds, 2),
+            "segundos_por_pagina" : round(per_page, 3),
+        }
+
+
+_POOL: DoclingConverterPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_docling_pool() -> DoclingConverterPool:
+    """Pool único por processo (criado no primeiro uso)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = DoclingConverterPool()
+        return _POOL
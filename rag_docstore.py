@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from langchain_core.documents import Document as LCDocument
+
+# ═══════════ CONFIG ═══════════
+DOCSTORE_FILE   = "docstore.sqlite"
+SQLITE_MAX_VARS = 900                     # limite de parâmetros por consulta (folga p/ 999)
+
+
+# ═════ Docstore em SQLite ═════
+class SQLiteDocStore:
+    """
+    Texto e metadados dos chunks de um índice, chaveados pelo hash do chunk.
+
+    • ``chunks(id PK, content, metadata)`` — metadados em JSON comprimido
+      (zlib); o ``dl_meta`` do Docling é repetitivo e encolhe bem.
+    • Consultas pontuais e em lote por ID, inserção e remoção incrementais —
+      nada é regravado por inteiro e nada é desserializado com pickle.
+    • WAL: leitores de outros processos não bloqueiam a escrita.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path  = path
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                id       TEXT PRIMARY KEY,
+                content  TEXT NOT NULL,
+                metadata BLOB NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+
+    # ───────── (de)serialização
+    @staticmethod
+    def _row(doc: LCDocument) -> tuple:
+        meta = json.dumps(doc.metadata, ensure_ascii=False, default=str).encode()
+        return doc.id, doc.page_content, zlib.compress(meta)
+
+    @staticmethod
+    def _doc(cid: str, content: str, metadata: bytes) -> LCDocument:
+        return LCDocument(id=cid, page_content=content, metadata=json.loads(zlib.decompress(metadata)))
+
+    # ───────── leitura
+    def get(self, cid: str) -> Optional[LCDocument]:
+        return self.mget([cid])[0]
+
+    def mget(self, ids: Sequence[str]) -> List[Optional[LCDocument]]:
+        """Documentos na mesma ordem de ``ids`` (``None`` se ausente)."""
+        found: Dict[str, LCDocument] = {}
+        unique = list(dict.fromkeys(ids))
+        with self._lock:
+            for i in range(0, len(unique), SQLITE_MAX_VARS):
+                batch = unique[i : i + SQLITE_MAX_VARS]
+                rows  = self._db.execute(
+                    f"SELECT id, content, metadata FROM chunks "
+                    f"WHERE id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update({row[0]: self._doc(*row) for row in rows})
+        return [found.get(cid) for cid in ids]
+
+    def __contains__(self, cid: object) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM chunks WHERE id = ?", (cid,),
+            ).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def ids(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM chunks").fetchall()
+        return (row[0] for row in rows)
+
+    # ───────── escrita
+    def add(self, docs: Iterable[LCDocument]) -> None:
+        """Insere (ou substitui) numa única transação."""
+        rows = [self._row(doc) for doc in docs]
+        if not rows:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Remove os IDs informados; devolve quantos existiam."""
+        ids = list(ids)
+        removed = 0
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for i in range(0, len(ids), SQLITE_MAX_VARS):
+                    batch = ids[i : i + SQLITE_MAX_VARS]
+                    removed += self._db.execute(
+                        f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch,
+                    ).rowcount
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
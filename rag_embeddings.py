@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from rag_jobs import report_progress
+from rag_tracing import annotate, span
+
+# ═══════════ CONFIG ═══════════
+EMBEDDING_MODEL_NAME  = "intfloat/multilingual-e5-large"
+EMBEDDING_DEVICE      = os.getenv("EMBEDDING_DEVICE", "cpu")            # "cpu", "cuda", "mps"…
+EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", "0"))    # 0 = padrão do torch
+EMBEDDING_BATCH_SIZE  = 32
+# Textos por rodada em ``embed_documents``: cada rodada vai para o cache em
+# disco e reporta progresso (job interrompido retoma do último lote gravado).
+EMBEDDING_PROGRESS_BATCH = EMBEDDING_BATCH_SIZE * 8
+
+EMBEDDING_CACHE_FOLDER      = Path("data") / "cache" / "embeddings"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_EVICT_RATIO = 0.10          # fração removida (LRU) quando lota
+
+QUERY_CACHE_SIZE = int(os.getenv("EMBEDDING_QUERY_CACHE_SIZE", "1024"))  # perguntas em memória (LRU)
+
+
+# ═════ Cache em disco ═════
+class EmbeddingCache:
+    """
+    Cache persistente de embeddings, chaveado por (modelo, sha256 do texto).
+
+    • Vetores em ``<modelo>.f32`` (``np.memmap`` float32, capacidade fixa).
+    • Índice chave → slot + último uso em ``<modelo>.sqlite``.
+    • Lotou → remove os ``EVICT_RATIO`` menos usados recentemente (LRU).
+    """
+
+    def __init__(
+        self,
+        model_name : str,
+        folder     : Path = EMBEDDING_CACHE_FOLDER,
+        max_entries: int  = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        folder.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+        self.model_name  = model_name
+        self.max_entries = max_entries
+        self._vec_path   = folder / f"{slug}.f32"
+        self._vectors: np.memmap | None = None
+        self._lock       = threading.Lock()
+
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+        self._db = sqlite3.connect(
+            folder / f"{slug}.sqlite", check_same_thread=False, isolation_level=None,
+        )
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS entries (
+                key       TEXT    PRIMARY KEY,
+                slot      INTEGER NOT NULL UNIQUE,
+                last_used REAL    NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_used);
+            CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self._open_vectors()
+
+    # ───────── utilidades
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def _info(self, name: str) -> str | None:
+        row = self._db.execute("SELECT value FROM info WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _open_vectors(self, dim: int | None = None) -> None:
+        """Abre o memmap; recria o cache se dimensão/capacidade mudaram."""
+        stored_dim = self._info("dim")
+        stored_cap = self._info("capacity")
+
+        if stored_dim is not None and (
+            int(stored_cap) != self.max_entries
+            or (dim is not None and int(stored_dim) != dim)
+            or not self._vec_path.exists()
+        ):
+            self._db.executescript(
+                "DELETE FROM entries; DELETE FROM free_slots; DELETE FROM info;"
+            )
+            self._vec_path.unlink(missing_ok=True)
+            stored_dim = None
+
+        if stored_dim is None:
+            if dim is None:
+                return                                  # ainda não sabemos a dimensão
+            self._vectors = np.memmap(
+                self._vec_path, dtype="float32", mode="w+", shape=(self.max_entries, dim),
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO info VALUES (?, ?)",
+                [("dim", str(dim)), ("capacity", str(self.max_entries)), ("next_slot", "0")],
+            )
+        else:
+            self._vectors = np.memmap(
+                self._vec_path, dtype="float32", mode="r+",
+                shape=(self.max_entries, int(stored_dim)),
+            )
+
+    # ───────── leitura
+    def get_many(self, texts: Sequence[str]) -> List[np.ndarray | None]:
+        """Vetores em cache (ou ``None``) na mesma ordem de ``texts``."""
+        with self._lock:
+            if self._vectors is None:
+                self.misses += len(texts)
+                return [None] * len(texts)
+
+            keys  = [self.key(t) for t in texts]
+            slots: Dict[str, int] = {}
+            for i in range(0, len(keys), 500):                 # limite de parâmetros SQL
+                part = keys[i : i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                slots.update(rows)
+
+            if slots:
+                now = time.time()
+                with self._db:                              # uma única transação
+                    self._db.execute("BEGIN")
+                    self._db.executemany(
+                        "UPDATE entries SET last_used = ? WHERE key = ?",
+                        [(now, k) for k in slots],
+                    )
+
+            out = [
+                np.array(self._vectors[slots[k]]) if k in slots else None for k in keys
+            ]
+            found = sum(v is not None for v in out)
+            self.hits   += found
+            self.misses += len(out) - found
+            return out
+
+    # ───────── escrita
+    def _allocate(self, n: int) -> List[int]:
+        """Reserva ``n`` slots: livres → nunca usados → despejo LRU."""
+        slots = [
+            s for (s,) in self._db.execute("SELECT slot FROM free_slots LIMIT ?", (n,))
+        ]
+        self._db.executemany("DELETE FROM free_slots WHERE slot = ?", [(s,) for s in slots])
+
+        next_slot = int(self._info("next_slot") or 0)
+        fresh     = min(n - len(slots), self.max_entries - next_slot)
+        slots    += range(next_slot, next_slot + fresh)
+        self._db.execute(
+            "UPDATE info SET value = ? WHERE name = 'next_slot'", (str(next_slot + fresh),)
+        )
+
+        missing = n - len(slots)
+        if missing > 0:
+            evict = max(missing, int(self.max_entries * EMBEDDING_CACHE_EVICT_RATIO))
+            rows  = self._db.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict,)
+            ).fetchall()
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in rows])
+            freed = [s for _, s in rows]
+            slots += freed[:missing]
+            self._db.executemany(
+                "INSERT INTO free_slots VALUES (?)", [(s,) for s in freed[missing:]]
+            )
+            self.evictions += len(rows)
+        return slots
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        arr = np.asarray(vectors, dtype="float32")
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != arr.shape[1]:
+                self._open_vectors(dim=arr.shape[1])
+
+            keys = list(dict.fromkeys(self.key(t) for t in texts))
+            rows = {k: i for i, k in enumerate(self.key(t) for t in texts)}
+            keys = keys[: self.max_entries]
+
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                known = {
+                    k for k in keys
+                    if self._db.execute("SELECT 1 FROM entries WHERE key = ?", (k,)).fetchone()
+                }
+                keys  = [k for k in keys if k not in known]
+                slots = self._allocate(len(keys))
+                for k, slot in zip(keys, slots):
+                    self._vectors[slot] = arr[rows[k]]
+                self._vectors.flush()                     # vetores antes das chaves
+                now = time.time()
+                self._db.executemany(
+                    "INSERT INTO entries VALUES (?, ?, ?)",
+                    [(k, slot, now) for k, slot in zip(keys, slots)],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        size  = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "entradas" : size,
+            "capacidade": self.max_entries,
+            "hits"     : self.hits,
+            "misses"   : self.misses,
+            "hit_rate" : round(self.hits / total, 3) if total else 0.0,
+            "despejos" : self.evictions,
+        }
+
+
+# ═════ Embeddings com cache ═════
+class CachedEmbeddings(Embeddings):
+    """
+    Consulta o ``EmbeddingCache`` antes de chamar o modelo de embeddings.
+    Perguntas (``embed_query``) ficam num LRU em memória à parte.
+    """
+
+    def __init__(
+        self,
+        base            : Embeddings,
+        cache           : EmbeddingCache,
+        query_cache_size: int = QUERY_CACHE_SIZE,
+    ):
+        self.base  = base
+        self.cache = cache
+
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._queries_max  = query_cache_size
+        self._queries_lock = threading.Lock()
+        self.query_hits    = 0
+        self.query_misses  = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("embeddings.documents", texts=len(texts)) as current:
+            cached  = self.cache.get_many(texts)
+            missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+
+            fresh: Dict[str, List[float]] = {}
+            for i in range(0, len(missing), EMBEDDING_PROGRESS_BATCH):
+                batch   = missing[i : i + EMBEDDING_PROGRESS_BATCH]
+                vectors = self.base.embed_documents(batch)
+                self.cache.put_many(batch, vectors)
+                fresh.update(zip(batch, vectors))
+                report_progress("embeddings", i + len(batch), len(missing))
+            current.set(cache_hits=len(texts) - len(missing), computed=len(missing))
+
+        return [
+            v.tolist() if v is not None else fresh[t] for t, v in zip(texts, cached)
+        ]
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._queries_lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+                self.query_hits += 1
+                annotate(query_cache_hits=1)
+                return vector
+        with span("embeddings.query"):
+            vector = self.base.embed_query(text)
+        with self._queries_lock:
+            self.query_misses += 1
+            self._queries[text] = vector
+            while len(self._queries) > self._queries_max:
+                self._queries.popitem(last=False)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Várias perguntas de uma vez: as que não estão no LRU vão num único lote."""
+        with self._queries_lock:
+            found = {t: self._queries[t] for t in texts if t in self._queries}
+            self.query_hits += len(found)
+        missing = list(dict.fromkeys(t for t in texts if t not in found))
+        annotate(query_cache_hits=len(found))
+        if missing:
+            # sem ``query_encode_kwargs`` configurado, query e documento são o mesmo encode
+            with span("embeddings.query", texts=len(missing)):
+                vectors = self.base.embed_documents(missing)
+            with self._queries_lock:
+                self.query_misses += len(missing)
+                for t, v in zip(missing, vectors):
+                    self._queries[t] = found[t] = v
+                while len(self._queries) > self._queries_max:
+                    self._queries.popitem(last=False)
+        return [found[t] for t in texts]
+
+    def query_stats(self) -> Dict[str, float]:
+        total = self.query_hits + self.query_misses
+        return {
+            "perguntas_em_cache" : len(self._queries),
+            "hits_perguntas"     : self.query_hits,
+            "taxa_perguntas"     : round(self.query_hits / total, 3) if total else 0.0,
+        }
+
+
+# ═════ Provedor compartilhado ═════
+class EmbeddingProvider(Embeddings):
+    """
+    Modelo de embeddings único por processo, carregado sob demanda.
+
+    • Thread-safe: o primeiro uso carrega o modelo; os demais reutilizam.
+    • Sempre passa pelo ``EmbeddingCache`` em disco.
+    • ``dimension`` vem do próprio modelo (sem embeddar texto vazio).
+    """
+
+    def __init__(
+        self,
+        model_name : str = EMBEDDING_MODEL_NAME,
+        device     : str = EMBEDDING_DEVICE,
+        num_threads: int = EMBEDDING_NUM_THREADS,
+    ):
+        self.model_name  = model_name
+        self.device      = device
+        self.num_threads = num_threads
+        self._lock       = threading.Lock()
+        self._embeddings: CachedEmbeddings | None = None
+        self._dimension : int | None              = None
+        self.load_seconds = 0.0
+
+    def _load(self) -> CachedEmbeddings:
+        if self._embeddings is not None:
+            return self._embeddings
+        with self._lock:
+            if self._embeddings is None:
+                with span("embeddings.load", model=self.model_name) as current:
+                    if self.num_threads > 0:
+                        import torch
+                        torch.set_num_threads(self.num_threads)
+
+                    base = HuggingFaceEmbeddings(
+                        model_name   = self.model_name,
+                        model_kwargs = {"device": self.device},
+                        encode_kwargs= {"batch_size": EMBEDDING_BATCH_SIZE},
+                    )
+                    client = getattr(base, "_client", None) or getattr(base, "client", None)
+                    self._dimension = (
+                        client.get_sentence_embedding_dimension()
+                        if client is not None else len(base.embed_query("passage: dim"))
+                    )
+                    self._embeddings = CachedEmbeddings(base, EmbeddingCache(self.model_name))
+                self.load_seconds = current.duration
+        return self._embeddings
+
+    def warm_up(self) -> None:
+        self._load()
+
+    @property
+    def dimension(self) -> int:
+        self._load()
+        return self._dimension
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._load().cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._load().embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self._load().embed_queries(texts)
+
+    def stats(self) -> Dict[str, float]:
+        if self._embeddings is None:
+            return {"carregado": False}
+        return (
+            {"carregado": True, "carga_s": round(self.load_seconds, 2)}
+            | self.cache.stats()
+            | self._embeddings.query_stats()
+        )
+
+
+_PROVIDERS: Dict[str, EmbeddingProvider] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL_NAME) -> EmbeddingProvider:
+    """Provedor único por modelo e por processo (o modelo só carrega no 1º uso)."""
+    with _PROVIDERS_LOCK:
+        if model_name not in _PROVIDERS:
+            _PROVIDERS[model_name] = EmbeddingProvider(model_name)
+        return _PROVIDERS[model_name]
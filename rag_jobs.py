@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ═══════════ CONFIG ═══════════
+JOBS_DB               = Path("data") / "jobs" / "ingestao.sqlite"
+INGEST_WORKERS        = int(os.getenv("RAG_INGEST_WORKERS", "1"))
+JOB_STALE_SECONDS     = int(os.getenv("RAG_JOB_STALE_SECONDS", "120"))      # sem heartbeat → retomável
+JOB_HEARTBEAT_SECONDS = int(os.getenv("RAG_JOB_HEARTBEAT_SECONDS", "15"))   # job vivo, mesmo parado numa etapa
+JOB_MAX_ATTEMPTS      = int(os.getenv("RAG_JOB_MAX_ATTEMPTS", "3"))         # interrupções até desistir
+
+ACTIVE_STATUSES = ("pendente", "executando")
+
+
+# ═════ Fila persistente ═════
+class JobQueue:
+    """
+    Jobs de ingestão em SQLite (sobrevivem a refresh do navegador e a
+    reinício do servidor).
+
+    status: pendente → executando → concluido | erro. Cada atualização grava
+    um heartbeat (e o worker grava um a cada ``JOB_HEARTBEAT_SECONDS``); job
+    "executando" sem heartbeat há ``JOB_STALE_SECONDS`` é considerado
+    interrompido e volta a ser executável — até ``JOB_MAX_ATTEMPTS``
+    tentativas, depois vira "erro" (PDF que derruba o processo não entra em loop).
+    """
+
+    def __init__(self, path: Path = JOBS_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                index_name TEXT    NOT NULL,
+                file_path  TEXT    NOT NULL,
+                file_hash  TEXT,
+                status     TEXT    NOT NULL DEFAULT 'pendente',
+                stage      TEXT    NOT NULL DEFAULT '',
+                done       INTEGER NOT NULL DEFAULT 0,
+                total      INTEGER NOT NULL DEFAULT 0,
+                messages   TEXT    NOT NULL DEFAULT '[]',
+                error      TEXT,
+                attempts   INTEGER NOT NULL DEFAULT 0,
+                created_at REAL    NOT NULL,
+                heartbeat  REAL    NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+            """
+        )
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def submit(self, index_name: str, file_path: str, file_hash: Optional[str]) -> int:
+        """Enfileira; o mesmo arquivo já pendente/executando devolve o job existente."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE index_name = ? AND file_hash IS ? "
+                    "AND status IN (?, ?) ORDER BY id DESC LIMIT 1",
+                    (index_name, file_hash, *ACTIVE_STATUSES),
+                ).fetchone()
+                if row is None:
+                    job_id = self._db.execute(
+                        "INSERT INTO jobs (index_name, file_path, file_hash, created_at, heartbeat) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (index_name, file_path, file_hash, now, now),
+                    ).lastrowid
+                else:
+                    job_id = row["id"]
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def claim(self, job_id: int) -> bool:
+        """Marca como executando se ninguém (outro processo/thread) o pegou."""
+        now = time.time()
+        return self._execute(
+            "UPDATE jobs SET status = 'executando', attempts = attempts + 1, heartbeat = ? "
+            "WHERE id = ? AND attempts < ? AND (status = 'pendente' "
+            "OR (status = 'executando' AND heartbeat < ?))",
+            (now, job_id, JOB_MAX_ATTEMPTS, now - JOB_STALE_SECONDS),
+        ).rowcount == 1
+
+    def abandon_exhausted(self, job_id: Optional[int] = None) -> int:
+        """Interrompidos que já gastaram ``JOB_MAX_ATTEMPTS`` → erro (um job ou todos)."""
+        now = time.time()
+        return self._execute(
+            "UPDATE jobs SET status = 'erro', error = ?, heartbeat = ? "
+            "WHERE (? IS NULL OR id = ?) AND attempts >= ? "
+            "AND status = 'executando' AND heartbeat < ?",
+            (
+                f"Interrompido {JOB_MAX_ATTEMPTS} vezes sem concluir — não será retomado.",
+                now, job_id, job_id, JOB_MAX_ATTEMPTS, now - JOB_STALE_SECONDS,
+            ),
+        ).rowcount
+
+    def update(self, job_id: int, **fields: Any) -> None:
+        fields.setdefault("heartbeat", time.time())
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def add_message(self, job_id: int, level: str, message: str) -> None:
+        with self._lock:
+            row = self._db.execute("SELECT messages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            messages = json.loads(row["messages"]) + [[level, message]]
+            self._db.execute(
+                "UPDATE jobs SET messages = ?, heartbeat = ? WHERE id = ?",
+                (json.dumps(messages, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["messages"] = json.loads(job["messages"])
+        return job
+
+    def active(self, index_name: str) -> List[int]:
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE index_name = ? AND status IN (?, ?) ORDER BY id",
+            (index_name, *ACTIVE_STATUSES),
+        ).fetchall()
+        return [row["id"] for row in rows]
+
+    def resumable(self) -> List[int]:
+        abandoned = self.abandon_exhausted()
+        if abandoned:
+            logger.warning("%d job(s) de ingestão desistido(s) após %d tentativas.", abandoned, JOB_MAX_ATTEMPTS)
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE status = 'pendente' "
+            "OR (status = 'executando' AND heartbeat < ?) ORDER BY id",
+            (time.time() - JOB_STALE_SECONDS,),
+        ).fetchall()
+        return [row["id"] for row in rows]
+
+
+# ═════ Progresso / mensagens do job atual ═════
+class _JobContext:
+    def __init__(self, queue: JobQueue, job_id: int):
+        self.queue  = queue
+        self.job_id = job_id
+
+
+_CURRENT_JOB: contextvars.ContextVar[Optional[_JobContext]] = contextvars.ContextVar(
+    "rag_job", default=None,
+)
+
+
+def report_progress(stage: str, done: int, total: int) -> None:
+    """Progresso da etapa (páginas convertidas, lotes embeddados…); fora de job, nada."""
+    ctx = _CURRENT_JOB.get()
+    if ctx is not None:
+        ctx.queue.update(ctx.job_id, stage=stage, done=int(done), total=int(total))
+
+
+def notify(level: str, message: str) -> bool:
+    """Registra a mensagem no job atual. False → não há job (caller usa ``st.*``)."""
+    ctx = _CURRENT_JOB.get()
+    if ctx is None:
+        return False
+    ctx.queue.add_message(ctx.job_id, level, message)
+    return True
+
+
+# ═════ Worker ═════
+class IngestionWorker:
+    """
+    Pool de threads que executa ``index_document`` fora da thread do script.
+    Só indexa: a cadeia RAG (LLM, ``st.secrets``) é montada pela sessão
+    quando o job conclui.
+
+    Na criação, retoma jobs pendentes ou interrompidos (servidor reiniciado).
+    Reprocessar do início é barato: embeddings vêm do cache em disco e
+    chunks já gravados são ignorados pela deduplicação.
+    """
+
+    def __init__(self, queue: JobQueue | None = None, workers: int = INGEST_WORKERS):
+        self.queue     = queue or JobQueue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="ingestao",
+        )
+        resumed = self.queue.resumable()
+        for job_id in resumed:
+            self._executor.submit(self._run, job_id)
+        if resumed:
+            logger.info("Retomando %d job(s) de ingestão.", len(resumed))
+
+    def submit(self, file_path: str, index_name: str, file_hash: Optional[str] = None) -> int:
+        job_id = self.queue.submit(index_name, file_path, file_hash)
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _heartbeat(self, job_id: int, stop: threading.Event) -> None:
+        """Mantém o job "vivo" enquanto roda (conversão de uma janela pode passar de minutos)."""
+        while not stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                self.queue.update(job_id)
+            except sqlite3.Error as exc:
+                logger.warning("Heartbeat do job %d falhou: %s", job_id, exc)
+
+    def _run(self, job_id: int) -> None:
+        if not self.queue.claim(job_id):
+            self.queue.abandon_exhausted(job_id)        # esgotado → erro; senão já em execução/concluído
+            return
+        job   = self.queue.get(job_id)
+        token = _CURRENT_JOB.set(_JobContext(self.queue, job_id))
+        stop  = threading.Event()
+        beat  = threading.Thread(
+            target=self._heartbeat, args=(job_id, stop),
+            name=f"ingestao-heartbeat-{job_id}", daemon=True,
+        )
+        beat.start()
+        try:
+            from rag_pipeline import index_document     # import tardio (evita ciclo)
+
+            index_document(job["file_path"], job["index_name"], job["file_hash"])
+            self.queue.update(job_id, status="concluido", stage="concluido")
+        except Exception as exc:
+            self.queue.update(job_id, status="erro", error=f"{type(exc).__name__}: {exc}")
+            logger.exception("Job de ingestão %d falhou.", job_id)
+        finally:
+            stop.set()
+            beat.join()
+            _CURRENT_JOB.reset(token)
+
+
+_WORKER: IngestionWorker | None = None
+_WORKER_LOCK = threading.Lock()
+
+
+def get_ingestion_worker() -> IngestionWorker:
+    """Worker único por processo (retoma a fila no primeiro uso)."""
+    global _WORKER
+    with _WORKER_LOCK:
+        if _WORKER is None:
+            _WORKER = IngestionWorker()
+        return _WORKER
@@ -1,181 +1,697 @@
 from __future__ import annotations
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 from pathlib import Path
-import hashlib, json, shutil
+import hashlib, json, logging, os, shutil, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 
 import streamlit as st
 import faiss                              
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
 from langchain_core.documents import Document as LCDocument
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.chains.combine_documents.stuff import create_stuff_documents_chain
-from langchain.chains.retrieval import create_retrieval_chain
 from langchain_anthropic import ChatAnthropic  
-from langchain_docling import DoclingLoader
-from langchain_docling.loader import ExportType
-import pandas as pd, json, io
-
+from langchain_docling.loader import MetaExtractor
+from docling_core.types.doc import DoclingDocument
+
+from rag_cache import ExactAnswerCache, get_exact_cache, get_semantic_cache
+from rag_docling import DOCLING_PAGE_WINDOW, get_docling_pool
+from rag_embeddings import EMBEDDING_MODEL_NAME, get_embeddings
+from rag_jobs import notify, report_progress
+from rag_registry import DocumentRegistry
+from rag_tracing import annotate, run_in_context, span
+from rag_vectorstore import SegmentedFAISS
 from utils import (
     log_time,
     prefix_documents_for_e5,
+    prefix_queries_for_e5,
     count_tokens,
+    pack_documents,
     #extract_metadata,
     format_response,
+    format_response_stream,
 )
 
+logger = logging.getLogger(__name__)
+
 # ═══════════ CONFIG ═══════════
 DATA_FOLDER      = Path("data")
 DOCUMENTS_FOLDER = DATA_FOLDER / "documentos"
 INDEX_FOLDER     = DATA_FOLDER / "indexes"
 INDEX_FOLDER.mkdir(parents=True, exist_ok=True)
 
-EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large"
 LLM_MODEL_NAME = "claude-sonnet-4-20250514"
 TOKEN_LIMIT          = 7000
 
+# Tokenizer usado para estimar o tamanho do prompt (aproximação do LLM)
+TOKENIZER_MODEL_NAME = EMBEDDING_MODEL_NAME
+
+# Chamadas simultâneas ao LLM no modo lote (``RagChainWrapper.batch_invoke``)
+BATCH_MAX_CONCURRENCY = int(os.getenv("RAG_BATCH_MAX_CONCURRENCY", "4"))
+
+
+def _parse_overrides(value: str) -> Dict[str, str]:
+    return dict(item.strip().split("=", 1) for item in value.split(",") if "=" in item)
+
+
+# Tipo de índice FAISS por módulo ("flat", "hnsw", "ivf"); ausente = automático
+# pelo tamanho do corpus. Ex.: RAG_INDEX_TYPES="logistica=ivf,atacado=flat"
+INDEX_TYPE_OVERRIDES = _parse_overrides(os.getenv("RAG_INDEX_TYPES", ""))
+
+# Armazenamento dos vetores ("float32", "fp16", "sq8", "pq"): padrão global
+# + exceções por módulo. Ex.: RAG_VECTOR_STORAGE=sq8
+#                             RAG_VECTOR_STORAGES="logistica=pq"
+VECTOR_STORAGE           = os.getenv("RAG_VECTOR_STORAGE", "float32")
+VECTOR_STORAGE_OVERRIDES = _parse_overrides(os.getenv("RAG_VECTOR_STORAGES", ""))
+
+# Índices consultados pela busca global (um por módulo) → rótulo exibido
+MODULE_INDEXES = {
+    "supermercado"         : "🛒 Supermercado",
+    "distribuicao"         : "🚚 Distribuição",
+    "atacado"              : "🏬 Atacado",
+    "servicos_financeiros" : "💳 Serviços Financeiros",
+    "farmacia"             : "💊 Farmácia",
+    "logistica"            : "🚛 Logística",
+    "turismo"              : "✈️ Turismo",
+    "restaurante"          : "🍽️ Restaurante",
+}
+FEDERATED_TOP_K = 20                      # chunks (de todos os módulos) enviados ao LLM
+
 
 # ═════ Wrapper de saída ═════
+@dataclass
+class StreamResult:
+    """
+    Metadados de UMA chamada a ``stream``, preenchidos enquanto a resposta
+    sai. A cadeia é compartilhada entre sessões (``st.cache_resource``) →
+    nada por pergunta fica na instância.
+    """
+
+    context: List[LCDocument] = field(default_factory=list)
+    ttft   : Optional[float]  = None           # tempo até o primeiro pedaço (s)
+    cached : bool             = False          # veio do cache semântico/exato
+
+
 class RagChainWrapper:
-    def __init__(self, chain, template: str):
-        self._chain    = chain
-        self._template = template
+    """
+    Pergunta → embedding (LRU) → cache semântico → MMR → empacota o contexto
+    no orçamento de tokens → chama o LLM.
+
+    • Perguntas embeddadas com o prefixo E5 ``query:`` (par do ``passage:``).
+    • Mesma pergunta normalizada + mesmos chunks recuperados + mesmo modelo
+      e template → resposta do cache em disco, sem LLM.
+    • Cache semântico (desligado por padrão, ver ``rag_cache``): pergunta
+      quase idêntica que recuperou os MESMOS chunks → resposta guardada.
+    • Cada chunk recuperado é medido com o tokenizer (em cache); os melhores
+      entram primeiro até ``TOKEN_LIMIT`` e o restante é descartado.
+    • ``stream`` devolve a resposta em pedaços conforme o LLM gera; o contexto
+      usado, o tempo até o primeiro token e se veio do cache vão para o
+      ``StreamResult`` passado pelo chamador.
+    • ``batch_invoke`` responde várias perguntas: embeddings num lote, busca
+      matricial nos segmentos e LLM em paralelo (``BATCH_MAX_CONCURRENCY``).
+    """
 
-    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
-        approx = count_tokens(
-            self._template.format(context="", input=inputs.get("input", "")),
-            model_name=EMBEDDING_MODEL_NAME,
+    def __init__(
+        self,
+        vectorstore  : SegmentedFAISS,
+        doc_chain,
+        template     : str,
+        search_kwargs: Dict[str, Any],
+        model_name   : str = LLM_MODEL_NAME,
+    ):
+        self._vectorstore   = vectorstore
+        self._search_kwargs = search_kwargs
+        self._init_chain(doc_chain, template, model_name, cache_key=str(vectorstore.path))
+
+    def _init_chain(self, doc_chain, template: str, model_name: str, cache_key: str) -> None:
+        """Campos comuns a toda cadeia (um índice ou federada)."""
+        self._model_name = model_name
+        self._doc_chain  = doc_chain
+        self._template   = template
+        self._cache_key  = cache_key
+
+    def _pack(self, question: str, docs: List[LCDocument]) -> List[LCDocument]:
+        with span("tokenize.pack") as current:
+            base = count_tokens(
+                self._template.format(context="", input=question),
+                model_name=TOKENIZER_MODEL_NAME,
+            )
+            if base > TOKEN_LIMIT:
+                st.warning(f"⚠️ Prompt estimado em {base} tokens (limite {TOKEN_LIMIT}).")
+
+            packed, used = pack_documents(docs, TOKEN_LIMIT - base, TOKENIZER_MODEL_NAME)
+            current.set(
+                prompt_tokens=base, context_tokens=used,
+                chunks_in=len(docs), chunks_out=len(packed),
+                truncated=len(packed) < len(docs),
+            )
+        return packed
+
+    # ───────── pontos de extensão (ver ``FederatedRagChain``)
+    def _embed_many(self, questions: List[str]) -> List[List[float]]:
+        embeddings = self._vectorstore.embeddings
+        queries    = prefix_queries_for_e5(questions)
+        if hasattr(embeddings, "embed_queries"):
+            return embeddings.embed_queries(queries)
+        return [embeddings.embed_query(q) for q in queries]
+
+    def _generation(self):
+        """Versão do(s) índice(s) — invalida o cache semântico quando muda."""
+        self._vectorstore.refresh()
+        return self._vectorstore.generation
+
+    def _search_many(self, vectors: List[List[float]]) -> List[List[LCDocument]]:
+        return self._vectorstore.max_marginal_relevance_search_batch(
+            vectors, **self._search_kwargs,
         )
-        if approx > TOKEN_LIMIT:
-            st.warning(f"⚠️ Prompt estimado em {approx} tokens (limite {TOKEN_LIMIT}).")
 
-        output = self._chain.invoke(inputs)
+    # ───────── etapas comuns
+    def _prepare(self, question: str):
+        """(vetor da pergunta, geração do índice)."""
+        with span("embed_query"):
+            vector = self._embed_many([question])[0]
+        return vector, self._generation()
+
+    def _retrieve(self, question: str, vector: List[float]) -> List[LCDocument]:
+        with span("search") as current:
+            docs = self._search_many([vector])[0]
+            current.set(chunks=len(docs))
+        return self._pack(question, docs)
+
+    def _exact_key(self, question: str, context: List[LCDocument]) -> str:
+        return ExactAnswerCache.key(question, context, self._model_name, self._template)
+
+    def _exact_lookup(self, key: str) -> Optional[str]:
+        with span("cache.exact") as current:
+            answer = get_exact_cache().get(key)
+            current.set(hit=answer is not None)
+        return answer
+
+    def _lookup(
+        self,
+        question  : str,
+        vector    : List[float],
+        generation,
+        context   : List[LCDocument],
+    ) -> tuple[str, Optional[str], str]:
+        """(chave do cache exato, resposta em cache ou None, origem): exato → semântico."""
+        key    = self._exact_key(question, context)
+        answer = self._exact_lookup(key)
+        if answer is not None:
+            return key, answer, "cache exato"
+        with span("cache.semantic") as current:
+            answer = get_semantic_cache().lookup(self._cache_key, generation, vector, context)
+            current.set(hit=answer is not None)
+        return key, answer, "cache semântico" if answer is not None else ""
+
+    def _generate(self, inputs: Dict[str, Any]) -> str:
+        with span("llm"):
+            raw = self._doc_chain.invoke(inputs)
+        with span("format"):
+            return format_response(raw)
 
-      
-        # if "context" in output:
+    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        with span("rag.invoke", index=self._cache_key):
+            return self._invoke(inputs)
+
+    __call__ = invoke
+
+    def _invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        question = inputs.get("input", "")
+        vector, generation = self._prepare(question)
+        context = self._retrieve(question, vector)
+        key, answer, _ = self._lookup(question, vector, generation, context)
+        if answer is None:
+            answer = self._generate({**inputs, "context": context})
+            get_exact_cache().put(key, answer)
+            get_semantic_cache().store(self._cache_key, generation, vector, answer, context)
+
+        # if context:
         #     st.write("🔍 Documentos recuperados:")
-        #     for doc in output["context"]:
+        #     for doc in context:
         #         st.write(f"{extract_metadata(doc)} — {doc.page_content}")
 
-        if "answer" in output:
-            output["answer"] = format_response(output["answer"])
-        return output
+        return {**inputs, "context": context, "answer": answer}
+
+    def stream(
+        self,
+        inputs: Dict[str, Any],
+        result: Optional[StreamResult] = None,
+    ) -> Iterator[str]:
+        """Pedaços da resposta; ``result`` recebe contexto, TTFT e origem desta chamada."""
+        result = result if result is not None else StreamResult()
+        with span("rag.stream", index=self._cache_key) as current:
+            yield from self._stream(inputs, result)
+            current.set(ttft_s=result.ttft, cached=result.cached)
+
+    def _stream(self, inputs: Dict[str, Any], result: StreamResult) -> Iterator[str]:
+        question = inputs.get("input", "")
+        start    = time.perf_counter()
+        vector, generation = self._prepare(question)
+        context = result.context = self._retrieve(question, vector)
+
+        key, answer, _ = self._lookup(question, vector, generation, context)
+        if answer is not None:
+            result.cached = True
+            result.ttft   = time.perf_counter() - start
+            yield answer
+            return
+
+        pieces: List[str] = []
+        with span("llm") as llm_span:
+            chunks = self._doc_chain.stream({**inputs, "context": context})
+            for piece in format_response_stream(chunks):
+                if result.ttft is None:
+                    result.ttft = time.perf_counter() - start
+                    llm_span.set(ttft_s=result.ttft)
+                pieces.append(piece)
+                yield piece
+
+        answer = "".join(pieces)
+        get_exact_cache().put(key, answer)
+        get_semantic_cache().store(self._cache_key, generation, vector, answer, context)
+
+    def batch_invoke(
+        self,
+        questions      : List[str],
+        max_concurrency: int = BATCH_MAX_CONCURRENCY,
+    ) -> List[Dict[str, Any]]:
+        """
+        Uma linha por pergunta (mesma ordem): pergunta, resposta, origem,
+        chunks e latencia_s. A latência soma a parcela de cada pergunta nas
+        etapas em lote (embedding + busca) ao tempo da própria geração.
+        """
+        if not questions:
+            return []
+        with span("rag.batch", index=self._cache_key, questions=len(questions)):
+            return self._batch_invoke(questions, max_concurrency)
+
+    def _batch_invoke(self, questions: List[str], max_concurrency: int) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+
+        with span("embed_query", queries=len(questions)):
+            vectors = self._embed_many(questions)
+        generation = self._generation()
+        semantic   = get_semantic_cache()
+
+        rows: List[Dict[str, Any]] = [
+            {"pergunta": q, "resposta": "", "origem": "", "chunks": 0, "latencia_s": 0.0}
+            for q in questions
+        ]
+        with span("search", queries=len(questions)):
+            found = self._search_many(vectors)
+        contexts: List[List[LCDocument]] = []
+        to_generate: List[int] = []
+        for i, docs in enumerate(found):
+            contexts.append(self._pack(questions[i], docs))
+            _, answer, origin = self._lookup(questions[i], vectors[i], generation, contexts[i])
+            if answer is None:
+                to_generate.append(i)
+            else:
+                rows[i]["resposta"], rows[i]["origem"] = answer, origin
+        annotate(semantic_hits=sum(row["origem"] == "cache semântico" for row in rows))
+
+        shared = (time.perf_counter() - start) / len(questions)
+
+        def _generate(i: int) -> None:
+            t0 = time.perf_counter()
+            try:
+                answer = self._generate({"input": questions[i], "context": contexts[i]})
+                get_exact_cache().put(self._exact_key(questions[i], contexts[i]), answer)
+                rows[i]["resposta"], rows[i]["origem"] = answer, "llm"
+            except Exception as exc:                            # uma falha não derruba o lote
+                rows[i]["resposta"], rows[i]["origem"] = f"Erro: {exc}", "erro"
+            rows[i]["latencia_s"] = time.perf_counter() - t0
+
+        if to_generate:
+            with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+                list(pool.map(run_in_context(_generate), to_generate))
+
+        for i, row in enumerate(rows):
+            row["chunks"]     = len(contexts[i])
+            row["latencia_s"] = round(row["latencia_s"] + shared, 3)
+            if row["origem"] == "llm":
+                semantic.store(self._cache_key, generation, vectors[i], row["resposta"], contexts[i])
+
+        annotate(llm_calls=len(to_generate), max_concurrency=max_concurrency)
+        return rows
+
+
+class FederatedRagChain(RagChainWrapper):
+    """
+    Busca global: a pergunta é embeddada uma vez e consultada em todos os
+    índices de módulo existentes, em paralelo (uma thread por índice; o FAISS
+    libera o GIL durante a busca). Os resultados são unidos pelo cosseno, os
+    ``k`` melhores vão para uma única chamada ao LLM e cada chunk leva o
+    módulo de origem em ``metadata["modulo"]``.
+    """
 
-    __call__ = invoke
+    def __init__(
+        self,
+        index_names: List[str],
+        doc_chain,
+        template   : str,
+        k          : int = FEDERATED_TOP_K,
+        model_name : str = LLM_MODEL_NAME,
+    ):
+        self._index_names = list(index_names)
+        self._k           = k
+        self._init_chain(
+            doc_chain, template, model_name, cache_key="federado:" + ",".join(self._index_names),
+        )
+
+    def _stores(self) -> Dict[str, SegmentedFAISS]:
+        stores = {name: load_vectorstore(name) for name in self._index_names}
+        return {name: vs for name, vs in stores.items() if vs is not None}
+
+    def _embed_many(self, questions: List[str]) -> List[List[float]]:
+        return get_embeddings().embed_queries(prefix_queries_for_e5(questions))
+
+    def _generation(self):
+        generations = []
+        for name, vs in self._stores().items():
+            vs.refresh()
+            generations.append((name, vs.generation))
+        return tuple(generations)
+
+    def _search_many(self, vectors: List[List[float]]) -> List[List[LCDocument]]:
+        stores = self._stores()
+        if not stores:
+            return [[] for _ in vectors]
+
+        def _search_index(name: str):
+            with span("search.index", index=name):
+                return stores[name].similarity_search_with_score_batch(vectors, self._k)
+
+        with ThreadPoolExecutor(max_workers=len(stores)) as pool:
+            per_index = dict(zip(stores, pool.map(run_in_context(_search_index), stores)))
+
+        merged: List[List[LCDocument]] = []
+        for q in range(len(vectors)):
+            hits = [
+                (score, name, doc)
+                for name, results in per_index.items()
+                for doc, score in results[q]
+            ]
+            hits.sort(key=lambda h: -h[0])
+            merged.append([
+                doc.model_copy(update={"metadata": {**doc.metadata, "modulo": name}})
+                for _, name, doc in hits[: self._k]
+            ])
+        annotate(indexes=len(stores))
+        return merged
 
 
 # ═════ Utilidades ═════
+HASH_BLOCK_SIZE = 1 << 20          # 1 MiB por leitura
+
+
 def _sha256_file(path: Path) -> str:
-    return hashlib.sha256(path.read_bytes()).hexdigest()
+    """SHA-256 lido em blocos (não carrega o PDF inteiro na memória)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _index_path(index_name: str) -> Path:
+    return INDEX_FOLDER / f"{index_name}_faiss_index"
+
+
+# leitura-modificação-escrita do metadata.json (worker de ingestão × UI)
+_REGISTRY_LOCK = threading.Lock()
+
+
+def is_document_indexed(index_name: str, file_hash: str) -> bool:
+    """Consulta o metadata.json do índice — não faz parsing nem carrega modelos."""
+    return file_hash in DocumentRegistry.load(_index_path(index_name))
+
 
+def _load_registry(index_name: str, vs: SegmentedFAISS) -> DocumentRegistry:
+    """Registro do índice; formato antigo (lista de hashes) é migrado na hora."""
+    registry = DocumentRegistry.load(_index_path(index_name))
+    if registry.needs_migration:
+        resolved = registry.migrate(vs.docstore, _sha256_file)
+        registry.save()
+        logger.info("Registro de '%s' migrado (%d documentos mapeados).", index_name, resolved)
+    return registry
 
-def _new_empty_index(embeddings: HuggingFaceEmbeddings) -> faiss.Index:
-    """Cria um IndexFlatL2 vazio com a dimensão correta."""
-    dim = len(embeddings.embed_query(""))
-    return faiss.IndexFlatL2(dim)
+
+def list_documents(index_name: str) -> List[Dict[str, Any]]:
+    """Documentos indexados no módulo (arquivo, nº de chunks, data)."""
+    return DocumentRegistry.load(_index_path(index_name)).summary()
+
+
+def _remove_from_index(vs: SegmentedFAISS, registry: DocumentRegistry, file_hash: str) -> int:
+    """Apaga do índice os chunks que só este documento usava."""
+    orphans = registry.remove(file_hash)
+    with span("vectorstore.delete", chunks=len(orphans)):
+        vs.delete(orphans)
+    get_semantic_cache().invalidate(str(vs.path))
+    return len(orphans)
+
+
+def delete_document(index_name: str, file_hash: str) -> int:
+    """Remove o documento do módulo; devolve quantos chunks saíram do índice."""
+    vs = load_vectorstore(index_name)
+    if vs is None:
+        return 0
+    with _REGISTRY_LOCK:
+        registry = _load_registry(index_name, vs)
+        if file_hash not in registry:
+            return 0
+        removed = _remove_from_index(vs, registry, file_hash)
+        registry.save()
+    return removed
+
+
+def _chunk_id(doc: LCDocument) -> str:
+    """ID endereçado por conteúdo: md5 do texto (já prefixado) do chunk."""
+    return hashlib.md5(doc.page_content.encode()).hexdigest()
+
+
+def _dedup_chunks(
+    documents: List[LCDocument],
+    existing : Any = (),
+) -> tuple[List[LCDocument], List[str]]:
+    """
+    Remove chunks repetidos (no próprio lote ou já presentes em ``existing``).
+    ``existing`` deve suportar ``in`` em O(1) — ex.: o próprio ``SegmentedFAISS``.
+    """
+    docs: List[LCDocument] = []
+    ids : List[str]        = []
+    seen: set[str]         = set()
+    for d in documents:
+        cid = _chunk_id(d)
+        if cid in seen or cid in existing:
+            continue
+        seen.add(cid)
+        d.metadata["chunk_id"] = cid
+        docs.append(d)
+        ids.append(cid)
+    return docs, ids
+
+
+# índices abertos no processo (compartilhados por todas as sessões)
+_VECTORSTORES: Dict[str, SegmentedFAISS] = {}
+_VECTORSTORES_LOCK = threading.Lock()
+
+
+def index_exists(index_name: str) -> bool:
+    return SegmentedFAISS.exists(_index_path(index_name))
+
+
+def _open_vectorstore(index_name: str, embeddings: Embeddings | None = None) -> SegmentedFAISS:
+    return SegmentedFAISS.open(
+        _index_path(index_name), embeddings or get_embeddings(),
+        index_type=INDEX_TYPE_OVERRIDES.get(index_name, "auto"),
+        storage=VECTOR_STORAGE_OVERRIDES.get(index_name, VECTOR_STORAGE),
+    )
+
+
+def load_vectorstore(index_name: str) -> SegmentedFAISS | None:
+    """
+    Índice do módulo, aberto uma vez por processo (``None`` se ainda não existe).
+
+    A mesma instância é usada pelas perguntas e pela ingestão → chunks novos
+    ficam visíveis para todas as sessões sem recarregar nada.
+    """
+    with _VECTORSTORES_LOCK:
+        if index_name not in _VECTORSTORES:
+            if not index_exists(index_name):
+                return None
+            _VECTORSTORES[index_name] = _open_vectorstore(index_name)
+        return _VECTORSTORES[index_name]
+
+
+def _new_empty_index() -> faiss.Index:
+    """Cria um IndexFlatIP vazio (cosseno em vetores E5 normalizados)."""
+    return faiss.IndexFlatIP(get_embeddings().dimension)
+
+
+# ═════ Mensagens de ingestão ═════
+def _notify(level: str, message: str) -> None:
+    """Dentro de um job de ingestão → registra no job; senão → ``st.<level>``."""
+    if not notify(level, message):
+        getattr(st, level)(message)
 
 
 # ═════ Carregar PDF ═════
+def _is_table_chunk(doc: LCDocument) -> bool:
+    """True se todos os itens Docling do chunk forem tabelas."""
+    items = doc.metadata.get("dl_meta", {}).get("doc_items", [])
+    return bool(items) and all(it.get("label") == "table" for it in items)
+
+
 @log_time
-def load_documents_with_docling(
-    file_path: str,
-    export_type: ExportType = ExportType.DOC_CHUNKS,
-) -> List[LCDocument]:
-    return DoclingLoader(file_path=file_path, export_type=export_type).load()
+def convert_with_docling(file_path: str) -> tuple[List[LCDocument], List[LCDocument]]:
+    """
+    Converte o PDF UMA única vez e devolve (chunks de texto, tabelas em JSON).
+
+    • Conversão em janelas de páginas (``DOCLING_PAGE_WINDOW``) → progresso
+      "conversao" reportado ao job de ingestão a cada janela.
+    • As janelas são unidas (``DoclingDocument.concatenate``) ANTES de chunkar
+      → seções e tabelas que cruzam a fronteira da janela ficam inteiras e os
+      chunks seguintes mantêm o cabeçalho. Sem ``concatenate`` (docling-core
+      antigo) → conversão única, sem progresso por janela.
+    • Texto → HybridChunker sobre o DoclingDocument (mesmo formato do DoclingLoader).
+    • Tabelas → ``TableItem.export_to_dataframe`` → registros JSON.
+    • Chunks compostos só por tabelas são removidos do texto (já estão em JSON).
+    """
+    pool    = get_docling_pool()                # modelos já carregados no processo
+    chunker = pool.chunker
+    meta    = MetaExtractor()
+
+    concatenate = getattr(DoclingDocument, "concatenate", None)
+    window      = DOCLING_PAGE_WINDOW if concatenate is not None else 0
+    janelas: List[DoclingDocument] = []
+    for result, done, total in pool.convert_windows(file_path, window=window):
+        janelas.append(result.document)
+        report_progress("conversao", done, total)
+    dl_doc = janelas[0] if len(janelas) == 1 else concatenate(janelas)
+
+    docs_texto: List[LCDocument] = [
+        LCDocument(
+            page_content=chunker.contextualize(chunk=chunk),
+            metadata=meta.extract_chunk_meta(file_path=file_path, chunk=chunk),
+        )
+        for chunk in chunker.chunk(dl_doc)
+    ]
+
+    docs_tabelas: List[LCDocument] = []
+    for i, table in enumerate(dl_doc.tables):
+        df = table.export_to_dataframe(doc=dl_doc)
+        if df.empty:
+            continue
+        pagina = table.prov[0].page_no if table.prov else None
+        docs_tabelas.append(
+            LCDocument(
+                page_content=json.dumps(
+                    df.to_dict(orient="records"),
+                    ensure_ascii=False,
+                    default=str,
+                ),
+                metadata={
+                    "source" : file_path,
+                    "subtype": "table",
+                    "table"  : i,
+                    "page"   : pagina,
+                    "note"   : "converted_to_json",
+                },
+            )
+        )
+
+    if docs_tabelas:
+        docs_texto = [d for d in docs_texto if not _is_table_chunk(d)]
+
+    return docs_texto, docs_tabelas
 
 
 # ═════ Criar / Carregar Vectorstore ═════
 @log_time
 def create_or_load_vectorstore(
     documents : List[LCDocument],
-    embeddings: HuggingFaceEmbeddings,
+    embeddings: Embeddings,
     index_name: str,
     file_path : str | None = None,
-) -> FAISS | None:
+    file_hash : str | None = None,
+) -> SegmentedFAISS | None:
     """
-    • Carrega o índice se todos os arquivos existirem.
-    • Se faltar index.faiss ou index.pkl → recria a partir dos documentos.
-    • Dedup de arquivo (hash) e de chunk (md5).
+    • Abre o índice segmentado do módulo (migra o formato antigo, se houver).
+    • Índice ilegível → recria a partir dos documentos.
+    • Dedup de arquivo (hash) e de chunk (md5 = ID no docstore e no índice).
+    • Chunks novos viram um segmento novo — nada do índice existente é regravado.
     """
-    index_path  = INDEX_FOLDER / f"{index_name}_faiss_index"
-    index_file  = index_path / "index.faiss"
-    pkl_file    = index_path / "index.pkl"
-    meta_path   = index_path / "metadata.json"
-
-    # ───────── criar diretório, se necessário
-    index_path.mkdir(parents=True, exist_ok=True)
-
-    # ───────── existe um índice VÁLIDO?
-    has_full_index = index_file.exists() and pkl_file.exists()
-
-    if has_full_index:
-        try:
-            vs = FAISS.load_local(
-                str(index_path), embeddings,
-                allow_dangerous_deserialization=True,
-            )
-        except Exception:
-            st.warning("🛠️ Índice corrompido — recriando.")
-            shutil.rmtree(index_path, ignore_errors=True)
-            index_path.mkdir(parents=True, exist_ok=True)
-            has_full_index = False
+    index_path = _index_path(index_name)
+
+    try:
+        vs = load_vectorstore(index_name)
+    except Exception:
+        _notify("warning", "🛠️ Índice corrompido — recriando.")
+        shutil.rmtree(index_path, ignore_errors=True)
+        vs = None
 
     # ───────── se não existe índice, precisamos de documentos
-    if not has_full_index:
+    if vs is None:
         if not documents:
-            st.error("Nenhum chunk disponível para criar o índice.")
+            _notify("error", "Nenhum chunk disponível para criar o índice.")
             return None
-        vs = FAISS.from_documents(documents, embeddings)
-        vs.save_local(str(index_path))
-        # registra hash do primeiro PDF
-        if file_path:
-            meta_path.write_text(json.dumps([_sha256_file(Path(file_path))]))
-        return vs                # índice criado → nada mais a fazer
+        with _VECTORSTORES_LOCK:
+            vs = _VECTORSTORES[index_name] = _open_vectorstore(index_name, embeddings)
 
     # ───────── deduplicação (arquivo e chunk)
-    pdf_hash = _sha256_file(Path(file_path)) if file_path else None
-    processed = (
-        set(json.loads(meta_path.read_text())) if meta_path.exists() else set()
-    )
-
-    if pdf_hash and pdf_hash in processed:
-        st.info("📄 Documento já indexado — pulando.")
-        return vs
+    pdf_hash = file_hash or (_sha256_file(Path(file_path)) if file_path else None)
+    with _REGISTRY_LOCK:
+        if pdf_hash and pdf_hash in _load_registry(index_name, vs):
+            _notify("info", "📄 Documento já indexado — pulando.")
+            return vs
 
-    existing_ids = set(vs.docstore._dict.keys())
-    new_docs: list[LCDocument] = []
-
-    for d in documents:
-        cid = hashlib.md5(d.page_content.encode()).hexdigest()
-        if cid not in existing_ids:
-            d.metadata["chunk_id"] = cid
-            new_docs.append(d)
+    # chaves do índice = IDs por conteúdo → lookup O(1), sem embeddar
+    chunk_ids = [_chunk_id(d) for d in documents]          # todos, p/ o registro
+    new_docs, new_ids = _dedup_chunks(documents, existing=vs)
+    annotate(index=index_name, new_chunks=len(new_docs), dup_chunks=len(documents) - len(new_docs))
 
     if new_docs:
-        vs.add_documents(new_docs)
-        vs.save_local(str(index_path))
-        st.success(f"✅ {len(new_docs)} novos chunks adicionados.")
-        if pdf_hash:
-            processed.add(pdf_hash)
-            meta_path.write_text(json.dumps(list(processed)))
+        with span("vectorstore.add", chunks=len(new_docs)):
+            vs.add_documents(new_docs, ids=new_ids)      # grava só um segmento novo
+        report_progress("indice", len(new_docs), len(new_docs))
+        get_semantic_cache().invalidate(str(vs.path))    # respostas antigas ficam obsoletas
+        _notify("success", f"✅ {len(new_docs)} novos chunks adicionados.")
+    else:
+        _notify("info", "📄 Todos os chunks já estavam no índice.")
+
+    # ───────── registro: documento → chunks; versão anterior do arquivo sai
+    if pdf_hash:
+        with _REGISTRY_LOCK:
+            registry = _load_registry(index_name, vs)
+            registry.add(pdf_hash, file_path or pdf_hash, chunk_ids)
+            # chunk compartilhado apagado por um delete concorrente → regrava
+            lost = {cid: d for d, cid in zip(documents, chunk_ids) if cid not in vs}
+            if lost:
+                vs.add_documents(list(lost.values()), ids=list(lost))
+            for old in registry.superseded(pdf_hash, file_path or pdf_hash):
+                removed = _remove_from_index(vs, registry, old)
+                _notify("info", f"♻️ Versão anterior substituída ({removed} chunks removidos).")
+            registry.save()
 
     return vs
 
 
 # ═════ Construir cadeia RAG ═════
-def create_rag_chain(vectorstore: FAISS) -> RagChainWrapper:
-    retriever = vectorstore.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": 20, "fetch_k": 100, "lambda_mult": 0.8},
-    )
-
-    llm = ChatAnthropic(
-        temperature=0.1,
-        model_name=LLM_MODEL_NAME,
-        api_key=st.secrets["ANTHROPIC_API_KEY"],       # 👈 usa a chave adicionada em .streamlit/secrets.toml
-        max_tokens=1000,
-    )
+def _build_doc_chain(llm: Optional[BaseChatModel] = None):
+    """(stuff chain, template, nome do modelo) — compartilhado pelas cadeias RAG."""
+    if llm is None:
+        llm = ChatAnthropic(
+            temperature=0.1,
+            model_name=LLM_MODEL_NAME,
+            api_key=st.secrets["ANTHROPIC_API_KEY"],   # 👈 usa a chave adicionada em .streamlit/secrets.toml
+            max_tokens=1000,
+            streaming=True,
+        )
 
     template = """
 Você é um assistente jurídico especializado.
@@ -194,66 +710,74 @@ Pergunta: {input}
 
 Resposta:
 """
-    prompt          = ChatPromptTemplate.from_template(template)
-    doc_chain       = create_stuff_documents_chain(llm=llm, prompt=prompt)
-    retrieval_chain = create_retrieval_chain(retriever, doc_chain)
-    return RagChainWrapper(retrieval_chain, template)
+    prompt     = ChatPromptTemplate.from_template(template)
+    doc_chain  = create_stuff_documents_chain(llm=llm, prompt=prompt)
+    model_name = getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+    return doc_chain, template, model_name
+
+
+def create_rag_chain(
+    vectorstore: SegmentedFAISS,
+    llm        : Optional[BaseChatModel] = None,
+) -> RagChainWrapper:
+    """``llm`` permite injetar outro chat model (ex.: fake local em testes)."""
+    search_kwargs = {"k": 20, "fetch_k": 100, "lambda_mult": 0.8}   # MMR
+    doc_chain, template, model_name = _build_doc_chain(llm)
+    return RagChainWrapper(vectorstore, doc_chain, template, search_kwargs, model_name)
+
+
+def create_federated_chain(
+    index_names: Optional[List[str]]     = None,
+    llm        : Optional[BaseChatModel] = None,
+) -> FederatedRagChain:
+    """Cadeia de busca global sobre os índices de ``MODULE_INDEXES``."""
+    doc_chain, template, model_name = _build_doc_chain(llm)
+    return FederatedRagChain(
+        index_names or list(MODULE_INDEXES), doc_chain, template, model_name=model_name,
+    )
 
 
 # ═════ Pipeline público ═════
-# rag_pipeline.py  –  somente a função process_document() atualizada
-# (o restante do arquivo permanece igual)
-
 @log_time
-def process_document(file_path: str, index_name: str) -> RagChainWrapper:
-    # 1 ───── Texto normal (DOC_CHUNKS)
-    docs_texto = load_documents_with_docling(
-        file_path,
-        export_type=ExportType.DOC_CHUNKS
-    )
-
-    # 2 ───── Tabelas em JSON (se a versão do Docling permitir)
-    TABLES_JSON = getattr(ExportType, "TABLES_AS_JSON", None)
-
-    if TABLES_JSON:
-        docs_tabelas = load_documents_with_docling(
-            file_path,
-            export_type=TABLES_JSON
-        )
-    else:
-        # fallback para versões antigas  ➜ converte cada tabela “na mão”
-        docs_tabelas = []
-        for d in docs_texto:
-            if d.metadata.get("subtype") == "table":
-        
-                df = pd.read_csv(io.StringIO(d.page_content))
-                d_json = LCDocument(
-                    page_content=json.dumps(
-                        df.to_dict(orient="records"),
-                        ensure_ascii=False
-                    ),
-                    metadata=d.metadata | {"note": "converted_to_json"}
-                )
-                docs_tabelas.append(d_json)
-
-        # remove as tabelas originais duplicadas do bloco de texto
-        docs_texto = [
-            d for d in docs_texto
-            if d.metadata.get("subtype") != "table"
-        ]
+def index_document(
+    file_path : str,
+    index_name: str,
+    file_hash : str | None = None,
+) -> SegmentedFAISS | None:
+    """
+    Indexa o PDF no índice do módulo (sem LLM — é o que o worker executa).
 
-    # 3 ───── Combina texto + tabelas
+    O hash do arquivo é conferido ANTES de qualquer parsing ou carga de
+    modelo: PDF já indexado → devolve ``None`` imediatamente.
+    """
+    # 0 ───── Dedup de arquivo (barato: só metadata.json)
+    file_hash = file_hash or _sha256_file(Path(file_path))
+    annotate(index=index_name)
+    if is_document_indexed(index_name, file_hash):
+        annotate(skipped=True)
+        _notify("info", "📄 Documento já indexado — pulando.")
+        return None
+
+    # 1 ───── Texto (DOC_CHUNKS) + tabelas em JSON numa única conversão
+    docs_texto, docs_tabelas = convert_with_docling(file_path)
+
+    # 2 ───── Combina texto + tabelas
     docs = docs_texto + docs_tabelas
+    annotate(text_chunks=len(docs_texto), table_chunks=len(docs_tabelas))
 
-    # 4 ───── Prefixa para embeddings E5
+    # 3 ───── Prefixa para embeddings E5
     docs = prefix_documents_for_e5(docs)
 
-    # 5 ───── Embeddings + vectorstore
-    embeddings = HuggingFaceEmbeddings(
-        model_name   = EMBEDDING_MODEL_NAME,
-        encode_kwargs={"batch_size": 32},
-    )
-    vs = create_or_load_vectorstore(docs, embeddings, index_name, file_path)
+    # 4 ───── Embeddings (modelo compartilhado + cache em disco) + vectorstore
+    embeddings = get_embeddings()
+    return create_or_load_vectorstore(docs, embeddings, index_name, file_path, file_hash)
+
 
-    # 6 ───── Cadeia RAG pronta
-    return create_rag_chain(vs)
+def process_document(
+    file_path : str,
+    index_name: str,
+    file_hash : str | None = None,
+) -> RagChainWrapper | None:
+    """``index_document`` + cadeia RAG pronta (``None`` se já indexado ou sem chunks)."""
+    vs = index_document(file_path, index_name, file_hash)
+    return create_rag_chain(vs) if vs is not None else None
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from rag_docstore import SQLiteDocStore
+
+# ═══════════ CONFIG ═══════════
+REGISTRY_FILE    = "metadata.json"
+REGISTRY_VERSION = 2
+
+
+# ═════ Registro de documentos ═════
+class DocumentRegistry:
+    """
+    Documentos de um índice → IDs dos chunks (``metadata.json``).
+
+    Formato::
+
+        {"version": 2,
+         "documents": {<sha256 do PDF>: {"file", "path", "chunks", "indexed_at"}}}
+
+    Chunks são endereçados por conteúdo e podem ser compartilhados entre
+    documentos (cláusulas repetidas em versões de um contrato) → ``remove``
+    só devolve os chunks que nenhum outro documento referencia.
+
+    O formato antigo (lista de hashes) é lido como documentos com
+    ``chunks=None``; ``migrate`` os reconstrói a partir do ``source`` gravado
+    nos metadados de cada chunk.
+    """
+
+    def __init__(self, path: Path, documents: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.path      = path
+        self.documents = documents or {}
+
+    @classmethod
+    def load(cls, index_path: Path) -> "DocumentRegistry":
+        path = index_path / REGISTRY_FILE
+        raw  = json.loads(path.read_text()) if path.exists() else {}
+        if isinstance(raw, list):                                  # formato antigo
+            return cls(path, {
+                h: {"file": None, "path": None, "chunks": None, "indexed_at": None}
+                for h in raw
+            })
+        return cls(path, raw.get("documents", {}))
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(
+            {"version": REGISTRY_VERSION, "documents": self.documents},
+            ensure_ascii=False,
+        ))
+        os.replace(tmp, self.path)
+
+    # ───────── consulta
+    def __contains__(self, file_hash: object) -> bool:
+        return file_hash in self.documents
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @property
+    def needs_migration(self) -> bool:
+        return any(doc["chunks"] is None for doc in self.documents.values())
+
+    def refcounts(self) -> Counter:
+        """chunk_id → nº de documentos que o contêm."""
+        return Counter(
+            cid for doc in self.documents.values() for cid in (doc["chunks"] or ())
+        )
+
+    def superseded(self, file_hash: str, path: str) -> List[str]:
+        """Outras versões do mesmo arquivo (mesmo nome, hash diferente)."""
+        name = Path(path).name
+        return [
+            h for h, doc in self.documents.items()
+            if h != file_hash and doc["file"] == name
+        ]
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Linhas para exibição (mais recentes primeiro)."""
+        rows = [
+            {
+                "hash"       : h,
+                "arquivo"    : doc["file"] or f"(legado) {h[:12]}…",
+                "chunks"     : len(doc["chunks"]) if doc["chunks"] is not None else None,
+                "indexado_em": doc["indexed_at"],
+            }
+            for h, doc in self.documents.items()
+        ]
+        return sorted(rows, key=lambda r: r["indexado_em"] or 0, reverse=True)
+
+    # ───────── escrita
+    def add(self, file_hash: str, path: str, chunk_ids: List[str]) -> None:
+        self.documents[file_hash] = {
+            "file"      : Path(path).name,
+            "path"      : str(path),
+            "chunks"    : list(dict.fromkeys(chunk_ids)),
+            "indexed_at": time.time(),
+        }
+
+    def remove(self, file_hash: str) -> List[str]:
+        """Tira o documento do registro; devolve os chunks que ficaram órfãos."""
+        doc = self.documents.pop(file_hash, None)
+        if doc is None or not doc["chunks"]:
+            return []
+        still_used = self.refcounts()
+        return [cid for cid in doc["chunks"] if cid not in still_used]
+
+    def migrate(self, docstore: SQLiteDocStore, hash_file: Callable[[Path], str]) -> int:
+        """
+        Preenche os documentos do formato antigo agrupando o docstore pelo
+        ``source`` dos chunks. Arquivo em disco com o mesmo hash → entrada
+        legada resolvida; arquivo sumido ou já sobrescrito por outra versão →
+        entrada ``legado:<source>`` (removível e substituível pelo nome).
+        Devolve quantos documentos foram mapeados.
+        """
+        pending = {h for h, doc in self.documents.items() if doc["chunks"] is None}
+        if not pending:
+            return 0
+        claimed = set(self.refcounts())
+        by_source: Dict[str, List[str]] = defaultdict(list)
+        for doc in docstore.mget(list(docstore.ids())):
+            if doc is not None and doc.id not in claimed and doc.metadata.get("source"):
+                by_source[doc.metadata["source"]].append(doc.id)
+
+        for source, chunk_ids in by_source.items():
+            path      = Path(source)
+            file_hash = hash_file(path) if path.exists() else None
+            key       = file_hash if file_hash in pending else f"legado:{source}"
+            self.add(key, source, chunk_ids)
+            self.documents[key]["indexed_at"] = None              # data original desconhecida
+            pending.discard(key)
+        for file_hash in pending:                                  # sem chunks: só dedup
+            self.documents[file_hash]["chunks"] = []
+        return len(by_source)
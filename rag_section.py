@@ -1,40 +1,165 @@
 from __future__ import annotations
 
+from datetime import datetime
 from pathlib import Path
+from typing import List
+import hashlib
+import pandas as pd
 import streamlit as st
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from rag_pipeline import create_rag_chain, process_document
+from rag_cache import get_exact_cache, get_semantic_cache
+from rag_docling import get_docling_pool
+from rag_embeddings import get_embeddings
+from rag_jobs import ACTIVE_STATUSES, get_ingestion_worker
+from rag_vectorstore import compression_report
+from rag_pipeline import (
+    HASH_BLOCK_SIZE,
+    MODULE_INDEXES,
+    StreamResult,
+    create_federated_chain,
+    create_rag_chain,
+    delete_document,
+    index_exists,
+    is_document_indexed,
+    list_documents,
+    load_vectorstore,
+)
 
-EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large"
+JOB_POLL_SECONDS = 2                      # intervalo de atualização do progresso
+
+_ETAPAS = {
+    ""          : "⏳ Na fila",
+    "conversao" : "📄 Convertendo páginas",
+    "embeddings": "🧠 Gerando embeddings",
+    "indice"    : "🗂️ Gravando índice",
+}
+
+
+def _salvar_upload(uploaded, destino: Path) -> str:
+    """Grava o upload em blocos e calcula o SHA-256 na mesma passada."""
+    digest = hashlib.sha256()
+    uploaded.seek(0)
+    with open(destino, "wb") as f:
+        for block in iter(lambda: uploaded.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def _ler_perguntas(uploaded) -> List[str]:
+    """TXT → uma pergunta por linha; CSV → coluna ``pergunta`` (ou a primeira)."""
+    if uploaded.name.lower().endswith(".csv"):
+        df  = pd.read_csv(uploaded, sep=None, engine="python", encoding="utf-8-sig")
+        col = next((c for c in df.columns if str(c).strip().lower() == "pergunta"), df.columns[0])
+        linhas = df[col].dropna().astype(str)
+    else:
+        linhas = uploaded.getvalue().decode("utf-8-sig").splitlines()
+    return [p.strip() for p in linhas if p.strip()]
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _acompanhar_ingestao(index_name: str, key_job: str, key_rag: str) -> None:
+    """Progresso do job em segundo plano; ao terminar, troca a cadeia e recarrega."""
+    job_id = st.session_state.get(key_job)
+    job    = get_ingestion_worker().queue.get(job_id) if job_id is not None else None
+    if job is None:
+        return
+
+    if job["status"] in ACTIVE_STATUSES:
+        etapa = _ETAPAS.get(job["stage"], job["stage"])
+        if job["total"]:
+            st.progress(
+                min(job["done"] / job["total"], 1.0),
+                text=f"{etapa}: {job['done']}/{job['total']}",
+            )
+        else:
+            st.progress(0.0, text=etapa)
+        for level, msg in job["messages"]:
+            getattr(st, level)(msg)
+        return
+
+    # ───────── terminou: nova cadeia na sessão + resumo exibido uma vez
+    del st.session_state[key_job]
+    if job["status"] == "concluido":
+        vs = load_vectorstore(index_name)
+        if vs is not None:
+            st.session_state[key_rag] = create_rag_chain(vs)
+    st.session_state[f"job_fim_{index_name}"] = job
+    st.rerun()
+
+
+def _resumo_ingestao(job: dict) -> None:
+    for level, msg in job["messages"]:
+        getattr(st, level)(msg)
+    if job["status"] != "concluido":
+        st.error(f"Falha ao criar o índice: {job['error']}")
+        return
+
+    docling = get_docling_pool().stats()
+    emb     = get_embeddings().stats()
+    st.caption(
+        f"Docling — carga dos modelos: {docling['carga_modelos_s']}s · "
+        f"conversão: {docling['segundos_por_pagina']}s/página · "
+        f"cache de embeddings: {emb.get('hits', 0)} hits / {emb.get('misses', 0)} misses"
+    )
+    st.success("✅ Índice criado/atualizado!")
+
+
+@st.cache_resource(show_spinner=False)
+def _federated_chain():
+    return create_federated_chain()
+
+
+def busca_global() -> None:
+    """Uma pergunta respondida com os documentos de todos os módulos."""
+    st.markdown("## 🔎 Busca em todos os módulos")
+
+    modulos = [MODULE_INDEXES[n] for n in MODULE_INDEXES if index_exists(n)]
+    if not modulos:
+        st.info("Nenhum módulo possui documentos indexados ainda.")
+        return
+    st.caption("Índices consultados: " + " · ".join(modulos))
+
+    pergunta = st.text_input("Pergunte sobre os contratos de toda a empresa:", key="ask_global")
+    if not pergunta:
+        return
+
+    rag  = _federated_chain()                  # compartilhada entre sessões
+    info = StreamResult()                      # fontes DESTA resposta
+    st.markdown("### Resposta:")
+    resp = st.write_stream(rag.stream({"input": pergunta}, info))
+    if not resp:
+        st.write("Não foi possível responder.")
+        return
+
+    por_modulo: dict = {}
+    for doc in info.context:
+        nome = doc.metadata.get("modulo", "")
+        por_modulo[nome] = por_modulo.get(nome, 0) + 1
+    st.caption(
+        "📚 Fontes: "
+        + " · ".join(f"{MODULE_INDEXES.get(n, n)} ({q})" for n, q in por_modulo.items())
+    )
 
 
 def rag_section(titulo: str, index_name: str, pasta_docs: Path) -> None:
     """Widget de Q&A + upload de PDFs isolado por módulo."""
     st.markdown(f"## {titulo}")
 
-    INDEX_PATH = Path("data/indexes") / f"{index_name}_faiss_index"
-
     # ────────────────────────────────────────────────────────────
     # 1) Carrega índice existente (cachê separado por caminho)
     # ────────────────────────────────────────────────────────────
     @st.cache_resource(show_spinner="🔄 Carregando índice…")
-    def _load_existing(index_path_str: str):
-        path = Path(index_path_str)
-        if not (path / "index.faiss").exists() or not (path / "index.pkl").exists():
+    def _load_existing(index_name: str):
+        vs = load_vectorstore(index_name)        # instância única do processo
+        if vs is None:
             return None
-        emb = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-        vs  = FAISS.load_local(
-            index_path_str,
-            emb,
-            allow_dangerous_deserialization=True,
-        )
         return create_rag_chain(vs)
 
     # cache em session_state, independente de outros módulos
     key_rag = f"rag_{index_name}"
+    key_job = f"job_{index_name}"
     if key_rag not in st.session_state:
-        st.session_state[key_rag] = _load_existing(str(INDEX_PATH))
+        st.session_state[key_rag] = _load_existing(index_name)
 
     rag = st.session_state[key_rag]
 
@@ -45,9 +170,85 @@ def rag_section(titulo: str, index_name: str, pasta_docs: Path) -> None:
             key=f"ask_{index_name}",
         )
         if pergunta:
-            resp = rag({"input": pergunta}).get("answer", "")
             st.markdown("### Resposta:")
-            st.write(resp or "Não foi possível responder.")
+            info = StreamResult()                   # desta pergunta (a cadeia é compartilhada)
+            resp = st.write_stream(rag.stream({"input": pergunta}, info))
+            if not resp:
+                st.write("Não foi possível responder.")
+            elif info.cached:
+                st.caption("♻️ Resposta reaproveitada do cache")
+            elif info.ttft is not None:
+                st.caption(f"⏱️ Primeiro token em {info.ttft:.2f}s")
+
+        with st.expander("📋 Perguntas em lote"):
+            arquivo = st.file_uploader(
+                "Envie um CSV (coluna `pergunta`) ou TXT (uma por linha):",
+                type=["csv", "txt"],
+                key=f"batch_{index_name}",
+            )
+            key_lote = f"lote_{index_name}"
+            if arquivo is not None:
+                perguntas = _ler_perguntas(arquivo)
+                st.caption(f"{len(perguntas)} perguntas encontradas.")
+                if perguntas and st.button("▶️ Responder lote", key=f"btn_batch_{index_name}"):
+                    with st.spinner(f"Respondendo {len(perguntas)} perguntas…"):
+                        st.session_state[key_lote] = pd.DataFrame(rag.batch_invoke(perguntas))
+
+            resultado = st.session_state.get(key_lote)
+            if resultado is not None:
+                st.dataframe(resultado, use_container_width=True)
+                st.download_button(
+                    "⬇️ Baixar respostas (CSV)",
+                    resultado.to_csv(index=False).encode("utf-8-sig"),
+                    file_name=f"respostas_{index_name}.csv",
+                    mime="text/csv",
+                    key=f"dl_batch_{index_name}",
+                )
+
+        vs = load_vectorstore(index_name)
+        if vs is None:
+            st.warning("⚠️ Índice vetorial indisponível — envie um PDF para recriá-lo.")
+        else:
+            with st.expander("⚙️ Índice vetorial"):
+                st.dataframe(vs.index_info(), use_container_width=True)
+                exato, semantico = get_exact_cache().stats(), get_semantic_cache().stats()
+                semantica = (
+                    f"{semantico['taxa_semantica']:.0%} de hits semânticos"
+                    if semantico["semantico_ativo"] else "cache semântico desligado"
+                )
+                st.caption(
+                    f"💾 Cache de respostas: {exato['taxa_exata']:.0%} de hits exatos "
+                    f"({exato['respostas_em_disco']} em disco) · {semantica}"
+                )
+                if st.button("📉 Comparar memória × recall", key=f"btn_quant_{index_name}"):
+                    with st.spinner("Medindo modos de armazenamento…"):
+                        relatorio = compression_report(vs)
+                    if relatorio:
+                        st.dataframe(relatorio, use_container_width=True)
+                    else:
+                        st.info("Índice sem vetores para comparar.")
+
+        with st.expander("📚 Documentos indexados"):
+            removido = st.session_state.pop(f"doc_removido_{index_name}", None)
+            if removido:
+                st.success(f"🗑️ '{removido[0]}' removido ({removido[1]} chunks apagados do índice).")
+            documentos = list_documents(index_name)
+            if not documentos:
+                st.caption("Nenhum documento registrado.")
+            for doc in documentos:
+                c1, c2, c3 = st.columns([6, 3, 1])
+                c1.markdown(f"**{doc['arquivo']}**")
+                data = (
+                    datetime.fromtimestamp(doc["indexado_em"]).strftime("%d/%m/%Y %H:%M")
+                    if doc["indexado_em"] else "—"
+                )
+                chunks = doc["chunks"] if doc["chunks"] is not None else "?"
+                c2.caption(f"{chunks} chunks · {data}")
+                if c3.button("🗑️", key=f"del_{index_name}_{doc['hash']}", help="Remover do índice"):
+                    with st.spinner("Removendo…"):
+                        n = delete_document(index_name, doc["hash"])
+                    st.session_state[f"doc_removido_{index_name}"] = (doc["arquivo"], n)
+                    st.rerun()
 
     st.divider()
 
@@ -61,17 +262,33 @@ def rag_section(titulo: str, index_name: str, pasta_docs: Path) -> None:
     if uploaded:
         pasta_docs.mkdir(parents=True, exist_ok=True)
         destino = pasta_docs / uploaded.name
-        with open(destino, "wb") as f:
-            f.write(uploaded.read())
+
+        # grava + hash uma única vez por upload (não a cada rerun)
+        key_hash = f"upload_hash_{index_name}"
+        salvo    = st.session_state.get(key_hash)
+        if salvo is None or salvo[0] != uploaded.file_id or not destino.exists():
+            salvo = (uploaded.file_id, _salvar_upload(uploaded, destino))
+            st.session_state[key_hash] = salvo
+        file_hash = salvo[1]
         st.success(f"📄 '{uploaded.name}' salvo!")
 
-        if st.button("🔍 Processar documento", key=f"btn_proc_{index_name}"):
-            with st.spinner("Gerando embeddings…"):
-                new_rag = process_document(str(destino), index_name)
+        if is_document_indexed(index_name, file_hash):
+            st.info("📄 Documento já indexado — pulando.")
+        elif key_job not in st.session_state and st.button(
+            "🔍 Processar documento", key=f"btn_proc_{index_name}",
+        ):
+            # roda no worker: sobrevive a refresh do navegador e a reinício
+            st.session_state[key_job] = get_ingestion_worker().submit(
+                str(destino), index_name, file_hash,
+            )
 
-            if new_rag:
-                st.success("✅ Índice criado/atualizado!")
-                st.session_state[key_rag] = new_rag        # substitui ↓
-                rag = new_rag                              # mostra Q&A já
-            else:
-                st.error("Falha ao criar o índice.")
+    # ───────────────────────── 4) Job de ingestão em andamento ─────────────
+    fim = st.session_state.pop(f"job_fim_{index_name}", None)
+    if fim is not None:
+        _resumo_ingestao(fim)
+    if key_job not in st.session_state:
+        ativos = get_ingestion_worker().queue.active(index_name)
+        if ativos:                                 # nova sessão → reencontra o job
+            st.session_state[key_job] = ativos[-1]
+    if key_job in st.session_state:
+        _acompanhar_ingestao(index_name, key_job, key_rag)
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ═══════════ CONFIG ═══════════
+TRACE_FOLDER       = Path("data") / "logs"
+TRACE_FILE         = TRACE_FOLDER / "rag_traces.jsonl"
+TRACE_MAX_BYTES    = int(os.getenv("RAG_TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_BACKUP_COUNT = int(os.getenv("RAG_TRACE_BACKUP_COUNT", "5"))
+TRACE_WINDOW       = 1000                  # últimas durações por etapa (p50/p95)
+
+# Endpoint local no formato texto do Prometheus (0 = desligado)
+METRICS_HOST = os.getenv("RAG_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("RAG_METRICS_PORT", "9464"))
+
+
+# ═════ Spans ═════
+class Span:
+    """Etapa medida; filhos herdam ``trace_id`` e apontam para o pai."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "duration", "attrs")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name      = name
+        self.trace_id  = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id   = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start     = time.time()
+        self.duration  = 0.0
+        self.attrs     = dict(attrs)
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id"  : self.trace_id,
+            "span_id"   : self.span_id,
+            "parent_id" : self.parent_id,
+            "name"      : self.name,
+            "start"     : round(self.start, 6),
+            "duration_s": round(self.duration, 6),
+            **self.attrs,
+        }
+
+
+_CURRENT: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "rag_span", default=None,
+)
+
+
+def current_span() -> Optional[Span]:
+    return _CURRENT.get()
+
+
+def annotate(**attrs: Any) -> None:
+    """Anota o span ativo (se houver) — ex.: ``annotate(cache_hit=True)``."""
+    span = _CURRENT.get()
+    if span is not None:
+        span.set(**attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    """Span aninhado no span ativo do contexto atual."""
+    parent = _CURRENT.get()
+    current = Span(name, parent, attrs)
+    token = _CURRENT.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as exc:
+        current.set(error=type(exc).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        try:
+            _CURRENT.reset(token)
+        except ValueError:                       # gerador finalizado em outro contexto
+            _CURRENT.set(parent)
+        _record(current)
+
+
+def run_in_context(func: Callable) -> Callable:
+    """Propaga o span atual para threads de um ``ThreadPoolExecutor``."""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+# ═════ Destinos: JSONL rotativo + métricas em memória ═════
+_logger: Optional[logging.Logger] = None
+_logger_lock = threading.Lock()
+
+
+def _trace_logger() -> logging.Logger:
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            TRACE_FOLDER.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT,
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("rag.traces")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _logger = logger
+        return _logger
+
+
+class _Metrics:
+    """Durações recentes (percentis), totais e somas de atributos numéricos por etapa."""
+
+    def __init__(self, window: int = TRACE_WINDOW):
+        self._lock      = threading.Lock()
+        self._recent: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._count: Dict[str, int]    = defaultdict(int)
+        self._sum: Dict[str, float]    = defaultdict(float)
+        self._attrs: Dict[tuple, float] = defaultdict(float)
+
+    def observe(self, span: Span) -> None:
+        with self._lock:
+            self._recent[span.name].append(span.duration)
+            self._count[span.name] += 1
+            self._sum[span.name]   += span.duration
+            for key, value in span.attrs.items():
+                if isinstance(value, bool):
+                    self._attrs[(span.name, key)] += int(value)
+                elif isinstance(value, (int, float)):
+                    self._attrs[(span.name, key)] += value
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = []
+            for name, values in sorted(self._recent.items()):
+                arr = np.fromiter(values, dtype="float64")
+                rows.append({
+                    "etapa"  : name,
+                    "n"      : self._count[name],
+                    "p50_ms" : round(float(np.percentile(arr, 50)) * 1000, 1),
+                    "p95_ms" : round(float(np.percentile(arr, 95)) * 1000, 1),
+                })
+            return rows
+
+    def prometheus(self) -> str:
+        lines = [
+            "# HELP rag_span_duration_seconds Duração das etapas do RAG.",
+            "# TYPE rag_span_duration_seconds summary",
+        ]
+        with self._lock:
+            for name, values in sorted(self._recent.items()):
+                arr = np.fromiter(values, dtype="float64")
+                for q in (0.5, 0.95):
+                    lines.append(
+                        f'rag_span_duration_seconds{{span="{name}",quantile="{q}"}} '
+                        f"{np.percentile(arr, q * 100):.6f}"
+                    )
+                lines.append(f'rag_span_duration_seconds_sum{{span="{name}"}} {self._sum[name]:.6f}')
+                lines.append(f'rag_span_duration_seconds_count{{span="{name}"}} {self._count[name]}')
+            lines += [
+                "# HELP rag_span_attribute_total Soma dos atributos numéricos dos spans.",
+                "# TYPE rag_span_attribute_total counter",
+            ]
+            for (name, key), total in sorted(self._attrs.items()):
+                lines.append(f'rag_span_attribute_total{{span="{name}",attr="{key}"}} {total:g}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = _Metrics()
+
+
+def _record(span: Span) -> None:
+    METRICS.observe(span)
+    try:
+        _trace_logger().info(json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+    except OSError as exc:                       # disco cheio/sem permissão → só métricas
+        logger.warning("Trace não gravado: %s", exc)
+
+
+def summary() -> List[Dict[str, Any]]:
+    """p50/p95 (ms) por etapa nas últimas ``TRACE_WINDOW`` execuções."""
+    return METRICS.summary()
+
+
+# ═════ Endpoint Prometheus ═════
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = METRICS.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):               # sem log de acesso no stdout
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[int]:
+    """Sobe ``/metrics`` numa thread daemon (uma vez por processo). Devolve a porta."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server.server_address[1]
+        if port <= 0:
+            return None
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as exc:
+            logger.warning("Endpoint de métricas indisponível em %s:%d: %s", host, port, exc)
+            return None
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        logger.info("Métricas do RAG em http://%s:%d/metrics", host, port)
+        return port
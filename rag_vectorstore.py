@@ -0,0 +1,975 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document as LCDocument
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from rag_docstore import DOCSTORE_FILE, SQLiteDocStore
+
+# ═══════════ CONFIG ═══════════
+MANIFEST_FILE        = "manifest.json"
+SEGMENTS_DIR         = "segments"
+COMPACT_MAX_SEGMENTS = int(os.getenv("RAG_COMPACT_MAX_SEGMENTS", "8"))
+# Fração de vetores apagados (tombstones) que dispara a compactação
+TOMBSTONE_COMPACT_RATIO = float(os.getenv("RAG_TOMBSTONE_COMPACT_RATIO", "0.2"))
+
+# Escolha automática do tipo de índice pelo nº de vetores do corpus
+INDEX_TYPES          = ("flat", "hnsw", "ivf")
+FLAT_MAX_VECTORS     = int(os.getenv("RAG_FLAT_MAX_VECTORS", "20000"))    # busca exata
+HNSW_MAX_VECTORS     = int(os.getenv("RAG_HNSW_MAX_VECTORS", "200000"))   # grafo, sem treino
+HNSW_M               = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH       = int(os.getenv("RAG_HNSW_EF_SEARCH", "128"))
+IVF_NPROBE           = int(os.getenv("RAG_IVF_NPROBE", "16"))
+IVF_TRAIN_MAX        = 100_000                                            # amostra de treino
+
+# Armazenamento dos vetores no índice: float32 (exato) ou comprimido.
+# Comprimido → guarda também vectors.npy (memmap, fora da RAM) e re-pontua
+# exatamente os ``RERANK_FACTOR × k`` melhores candidatos.
+VECTOR_STORAGES      = ("float32", "fp16", "sq8", "pq")
+RERANK_FACTOR        = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+PQ_MIN_TRAIN         = 256 * 39                                           # abaixo disso PQ → SQ8
+
+# Abertura preguiçosa: códigos do índice FAISS mapeados do arquivo, somente
+# leitura (page cache do SO compartilhado entre processos) e documentos lidos
+# só quando retornados. flat/SQ/PQ/HNSW → IO_FLAG_MMAP_IFC; IVF → IO_FLAG_MMAP
+# (listas invertidas). faiss sem IO_FLAG_MMAP_IFC → esses tipos vão para a RAM.
+MMAP_INDEXES         = os.getenv("RAG_MMAP_INDEXES", "1") == "1"
+IVF_FOURCC_PREFIXES  = (b"Iw", b"Iv")         # cabeçalho de IndexIVF* no arquivo
+IDS_FILE             = "ids.npy"              # chunk IDs (bytes de tamanho fixo)
+
+
+# ═════ Utilidades ═════
+def _write_json_atomic(path: Path, data: Any) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2))
+    os.replace(tmp, path)
+
+
+def _rekey_by_content(vs: FAISS) -> bool:
+    """
+    Converte índices antigos (chaves UUID) para IDs por conteúdo.
+
+    Vetores duplicados são removidos do FAISS sem re-embeddar nada.
+    Devolve True se o índice foi alterado.
+    """
+    if not any("-" in key for key in vs.docstore._dict):
+        return False
+
+    new_dict : Dict[str, LCDocument] = {}
+    drop     : List[int]             = []
+    for pos in range(vs.index.ntotal):
+        doc = vs.docstore._dict[vs.index_to_docstore_id[pos]]
+        cid = hashlib.md5(doc.page_content.encode()).hexdigest()
+        if cid in new_dict:
+            drop.append(pos)
+            continue
+        doc.id = doc.metadata["chunk_id"] = cid
+        new_dict[cid] = doc
+
+    if drop:
+        vs.index.remove_ids(np.asarray(drop, dtype="int64"))
+    vs.docstore._dict.clear()
+    vs.docstore._dict.update(new_dict)
+    vs.index_to_docstore_id = dict(enumerate(new_dict))   # ordem de inserção = posição
+    return True
+
+
+# ═════ Tipos de índice ═════
+def choose_index_type(n_vectors: int) -> str:
+    """flat (exato) → hnsw (médio) → ivf (grande, treinado)."""
+    if n_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if n_vectors <= HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf"
+
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def storage_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "float32"
+
+
+def _effective_storage(storage: str, n_vectors: int) -> str:
+    """PQ precisa de ~10k vetores para treinar; antes disso usa SQ8."""
+    if storage == "pq" and n_vectors < PQ_MIN_TRAIN:
+        return "sq8"
+    return storage
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Maior M (bytes por vetor) que divide a dimensão — 64 para o e5-large."""
+    return next(m for m in (64, 32, 16, 8, 4, 2, 1) if dim % m == 0)
+
+
+def _tune(index: faiss.Index) -> faiss.Index:
+    """Parâmetros de busca (não dependem do arquivo) + mapa direto p/ reconstruct."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+        index.make_direct_map()
+    return index
+
+
+def build_index(
+    vectors   : np.ndarray,
+    index_type: str,
+    storage   : str = "float32",
+) -> faiss.Index:
+    """Índice de produto interno (vetores E5 normalizados = cosseno)."""
+    n, dim  = vectors.shape
+    storage = _effective_storage(storage, n)
+    codec   = {
+        "float32": "Flat",
+        "fp16"   : "SQfp16",
+        "sq8"    : "SQ8",
+        "pq"     : f"PQ{_pq_subquantizers(dim)}",
+    }[storage]
+
+    if index_type == "hnsw":
+        spec = f"HNSW{HNSW_M}" + ("" if storage == "float32" else f",{codec}")
+    elif index_type == "ivf":
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))      # ≥ 39 vetores por lista
+        spec  = f"IVF{nlist},{codec}"
+    else:
+        spec  = codec
+
+    index = faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        sample = vectors
+        if n > IVF_TRAIN_MAX:
+            rows   = np.random.default_rng(0).choice(n, IVF_TRAIN_MAX, replace=False)
+            sample = vectors[np.sort(rows)]
+        index.train(sample)
+    index.add(vectors)
+    return _tune(index)
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _mmap_flags(path: Path) -> int:
+    """
+    ``IO_FLAG_MMAP`` só mapeia listas invertidas (IVF); flat, SQ, PQ e HNSW
+    precisam de ``IO_FLAG_MMAP_IFC`` (códigos e grafo mapeados) — com o
+    outro flag o arquivo inteiro é copiado para o heap.
+    """
+    with open(path, "rb") as f:
+        fourcc = f.read(4)
+    if fourcc.startswith(IVF_FOURCC_PREFIXES):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+
+def _read_index(path: Path, mmap_mode: bool = MMAP_INDEXES) -> faiss.Index:
+    flags = _mmap_flags(path) if mmap_mode else 0
+    return _tune(faiss.read_index(str(path), flags))
+
+
+def _write_ids(folder: Path, ids: Sequence[str]) -> None:
+    """``ids.npy``: chunk IDs como bytes de tamanho fixo (abre em memmap)."""
+    tmp = folder / "ids.tmp.npy"
+    np.save(tmp, np.asarray([cid.encode() for cid in ids], dtype="S"))
+    os.replace(tmp, folder / IDS_FILE)
+
+
+class _LazyIds(Sequence[str]):
+    """``ids.npy`` em memmap; decodifica só as posições acessadas."""
+
+    def __init__(self, array: np.ndarray):
+        self._array = array
+
+    def __len__(self) -> int:
+        return len(self._array)
+
+    def __getitem__(self, pos: int) -> str:
+        return self._array[pos].decode()
+
+    def __iter__(self) -> Iterator[str]:
+        return (cid.decode() for cid in self._array)
+
+
+def _to_similarity(index: faiss.Index, scores: np.ndarray) -> np.ndarray:
+    """Converte para cosseno: segmentos antigos (L2²) → 1 - d/2."""
+    if index.metric_type == faiss.METRIC_L2:
+        return 1.0 - scores / 2.0
+    return scores
+
+
+# ═════ Segmento ═════
+class _Segment:
+    """
+    Um lote imutável de vetores: ``index.faiss`` + ``ids.npy``.
+
+    A posição ``i`` no índice FAISS corresponde a ``ids[i]``; o texto e os
+    metadados ficam no docstore SQLite do índice. Se o índice é comprimido,
+    ``exact`` (``vectors.npy`` em memmap) guarda os float32 originais para
+    re-pontuação.
+
+    Aberto do disco: códigos do índice mapeados do arquivo (``MMAP_INDEXES``,
+    ver ``_mmap_flags``) e ids em memmap.
+    Segmentos antigos (``index.pkl`` ou ``docs.jsonl``) têm os documentos
+    movidos para o docstore na primeira abertura.
+    """
+
+    def __init__(
+        self,
+        name : str,
+        index: faiss.Index,
+        ids  : Sequence[str],
+        exact: np.ndarray | None = None,
+    ):
+        self.name  = name
+        self.index = index
+        self.ids   = ids
+        self.exact = exact
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _upgrade_docs(folder: Path, docstore: SQLiteDocStore) -> None:
+        """Documentos de formatos antigos → docstore (o pickle só é lido aqui)."""
+        pkl, jsonl = folder / "index.pkl", folder / "docs.jsonl"
+        if pkl.exists():
+            with open(pkl, "rb") as f:
+                ids, docs = pickle.load(f)
+            docstore.add(docs[cid] for cid in ids)
+            _write_ids(folder, ids)
+            pkl.unlink()
+        elif jsonl.exists():
+            with open(jsonl, "rb") as f:
+                docs = [
+                    LCDocument(id=raw["id"], page_content=raw["page_content"], metadata=raw["metadata"])
+                    for raw in map(json.loads, f)
+                ]
+            docstore.add(docs)
+            if not (folder / IDS_FILE).exists():
+                _write_ids(folder, [doc.id for doc in docs])
+            jsonl.unlink()
+            (folder / "docs.offsets.npy").unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, folder: Path, docstore: SQLiteDocStore) -> "_Segment":
+        cls._upgrade_docs(folder, docstore)
+        index = _read_index(folder / "index.faiss")
+        ids   = _LazyIds(np.load(folder / IDS_FILE, mmap_mode="r"))
+        exact = None
+        if (folder / "vectors.npy").exists():
+            exact = np.load(folder / "vectors.npy", mmap_mode="r")
+        return cls(folder.name, index, ids, exact)
+
+    def save(self, folder: Path) -> None:
+        """Grava numa pasta temporária e renomeia (segmento nunca fica pela metade)."""
+        tmp = folder.with_name(folder.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        faiss.write_index(self.index, str(tmp / "index.faiss"))
+        _write_ids(tmp, self.ids)
+        if self.exact is not None:
+            np.save(tmp / "vectors.npy", np.asarray(self.exact, dtype="float32"))
+        os.replace(tmp, folder)
+
+        # solta as cópias em RAM: daqui em diante lê do disco como um segmento aberto
+        if MMAP_INDEXES:
+            self.index = _read_index(folder / "index.faiss")
+        if self.exact is not None:
+            self.exact = np.load(folder / "vectors.npy", mmap_mode="r")
+
+    def vectors(self) -> np.ndarray:
+        if self.exact is not None:
+            return np.asarray(self.exact)
+        return self.index.reconstruct_n(0, self.index.ntotal)
+
+    def vectors_at(self, pos: np.ndarray) -> np.ndarray:
+        """Só as linhas ``pos`` (ordenadas → leitura sequencial no memmap)."""
+        if self.exact is not None:
+            return np.asarray(self.exact[pos])
+        return self.index.reconstruct_batch(np.asarray(pos, dtype="int64"))
+
+    def vector(self, pos: int) -> np.ndarray:
+        if self.exact is not None:
+            return np.asarray(self.exact[pos])
+        return self.index.reconstruct(pos)
+
+    def search_batch(
+        self, queries: np.ndarray, k: int,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (cossenos, posições) dos ``k`` melhores para cada linha de ``queries``,
+        numa única chamada ao FAISS; comprimido → re-pontua exato.
+        """
+        k = min(k, len(self))
+        if self.exact is None:
+            scores, pos = self.index.search(queries, k)
+            return [
+                (_to_similarity(self.index, s[p != -1]), p[p != -1])
+                for s, p in zip(scores, pos)
+            ]
+
+        _, cands = self.index.search(queries, min(k * RERANK_FACTOR, len(self)))
+        results  = []
+        for query, row in zip(queries, cands):
+            pos   = np.sort(row[row != -1])                     # leitura em ordem no memmap
+            exact = np.asarray(self.exact[pos]) @ query
+            best  = np.argsort(-exact)[:k]
+            results.append((exact[best], pos[best]))
+        return results
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.search_batch(query, k)[0]
+
+
+# ═════ Vectorstore segmentado ═════
+class SegmentedFAISS(VectorStore):
+    """
+    Índice FAISS em segmentos append-only.
+
+    • ``add_texts`` embeda SÓ os textos novos e grava um segmento novo
+      (custo de I/O proporcional ao documento, não ao índice inteiro).
+    • Buscas consultam todos os segmentos e unem os melhores resultados.
+    • ``compact`` funde os segmentos num só (automático acima de
+      ``COMPACT_MAX_SEGMENTS``) e, se o corpus cresceu, migra o tipo de
+      índice (flat → hnsw → ivf, ver ``choose_index_type``).
+    • Produto interno sobre vetores normalizados; scores = cosseno.
+    • ``storage`` comprime os vetores do índice (fp16, sq8, pq) com
+      re-pontuação exata dos melhores candidatos (ver ``compression_report``).
+    • ``manifest.json`` lista os segmentos ativos; é trocado de forma atômica.
+    • ``delete`` não reescreve segmentos: grava tombstones (segmento →
+      posições apagadas) no manifesto, filtrados na busca e descartados na
+      próxima compactação.
+    • Texto/metadados no ``docstore.sqlite`` (chave = hash do chunk); só os
+      documentos retornados por uma busca são lidos.
+    • Escritas não travam buscas: embedding, montagem e gravação do segmento
+      (e da compactação) acontecem fora de ``_lock``, que só cobre a troca da
+      lista de segmentos + manifesto; escritores se revezam em ``_write_lock``.
+
+    Layout::
+
+        <nome>_faiss_index/
+            manifest.json
+            docstore.sqlite
+            segments/seg-000001/{index.faiss, ids.npy[, vectors.npy]}
+    """
+
+    def __init__(
+        self,
+        path      : Path,
+        embedding : Embeddings,
+        index_type: str = "auto",
+        storage   : str = "float32",
+    ):
+        if index_type != "auto" and index_type not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice inválido: {index_type!r}")
+        if storage not in VECTOR_STORAGES:
+            raise ValueError(f"Armazenamento inválido: {storage!r}")
+        self.path       = Path(path)
+        self.embedding  = embedding
+        self.index_type = index_type            # "auto" ou tipo fixo (override)
+        self.storage    = storage
+        self._lock      = threading.RLock()       # só troca de estado (buscas nunca esperam I/O)
+        self._write_lock = threading.Lock()       # serializa escritores: add / delete / compact
+        self._segments  : List[_Segment]             = []
+        self._where_map : Optional[Dict[str, Tuple[int, int]]] = None   # montado sob demanda
+        self._version   = 0                       # muda a cada troca de segmentos
+        self.docstore   = SQLiteDocStore(self.path / DOCSTORE_FILE)
+        self._manifest  : Dict[str, Any]             = {
+            "version": 1, "generation": 0, "next_segment": 1, "segments": [], "deleted": {},
+        }
+        self._manifest_mtime = 0
+
+    # ───────── abertura
+    @staticmethod
+    def exists(path: Path) -> bool:
+        path = Path(path)
+        return (path / MANIFEST_FILE).exists() or (
+            (path / "index.faiss").exists() and (path / "index.pkl").exists()
+        )
+
+    @classmethod
+    def open(
+        cls,
+        path      : Path,
+        embedding : Embeddings,
+        index_type: str = "auto",
+        storage   : str = "float32",
+    ) -> "SegmentedFAISS":
+        """Abre (ou cria vazio) o índice; migra o formato antigo de ``save_local``."""
+        vs = cls(path, embedding, index_type, storage)
+        vs.path.mkdir(parents=True, exist_ok=True)
+        if not (vs.path / MANIFEST_FILE).exists():
+            vs._migrate_legacy()
+        vs.refresh()
+        return vs
+
+    def _migrate_legacy(self) -> None:
+        """``index.faiss``/``index.pkl`` na raiz → primeiro segmento."""
+        index_file, pkl_file = self.path / "index.faiss", self.path / "index.pkl"
+        if index_file.exists() and pkl_file.exists():
+            legacy = FAISS.load_local(
+                str(self.path), self.embedding,
+                allow_dangerous_deserialization=True,
+            )
+            _rekey_by_content(legacy)
+            ids = [legacy.index_to_docstore_id[i] for i in range(legacy.index.ntotal)]
+            self._write_segment(legacy.index, ids, [legacy.docstore._dict[cid] for cid in ids])
+            index_file.unlink()
+            pkl_file.unlink()
+        else:
+            self._save_manifest()
+
+    def refresh(self) -> None:
+        """Recarrega o manifesto se outro processo o alterou (só carrega segmentos novos)."""
+        manifest_path = self.path / MANIFEST_FILE
+        try:
+            mtime = manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime:                      # caminho comum: sem lock
+            return
+        with self._lock:
+            if mtime == self._manifest_mtime:
+                return
+            manifest = json.loads(manifest_path.read_text())
+            loaded   = {seg.name: seg for seg in self._segments}
+            segments = [
+                loaded.get(info["name"])
+                or _Segment.load(self.path / SEGMENTS_DIR / info["name"], self.docstore)
+                for info in manifest["segments"]
+            ]
+            self._manifest       = manifest
+            self._manifest_mtime = mtime
+            self._set_segments(segments)
+
+    def _set_segments(self, segments: List[_Segment]) -> None:
+        """Troca a lista de segmentos (leitores usam a lista antiga até o fim)."""
+        with self._lock:
+            self._segments, self._where_map = segments, None
+            self._version += 1
+
+    def _append_segment(self, segment: _Segment) -> None:
+        """Como ``_set_segments``, mas só indexa os ids do segmento novo."""
+        with self._lock:
+            s = len(self._segments)
+            where = self._where_map
+            if where is not None:
+                where = dict(where)
+                where.update({cid: (s, pos) for pos, cid in enumerate(segment.ids)})
+            self._segments, self._where_map = self._segments + [segment], where
+            self._version += 1
+
+    @property
+    def _where(self) -> Dict[str, Tuple[int, int]]:
+        """chunk_id → (segmento, posição). Só é montado quando preciso (dedup,
+        ``get_by_ids``) — abrir o índice para buscar não lê os ids. Montado fora
+        do lock; descartado se os segmentos mudaram no meio."""
+        where = self._where_map
+        if where is not None:
+            return where
+        with self._lock:
+            segments, deleted, version = self._segments, self._deleted(), self._version
+        where = {}
+        for s, seg in enumerate(segments):
+            dead = set(self._dead(seg, deleted).tolist())
+            where.update((cid, (s, pos)) for pos, cid in enumerate(seg.ids) if pos not in dead)
+        with self._lock:
+            if self._version == version:
+                self._where_map = where
+        return where
+
+    def _deleted(self) -> Dict[str, List[int]]:
+        """Tombstones atuais. O dict nunca é alterado no lugar (escritores trocam a referência)."""
+        return self._manifest.get("deleted", {})
+
+    def _snapshot(self) -> Tuple[List[_Segment], Dict[str, List[int]]]:
+        """(segmentos, tombstones) coerentes entre si — o lock só cobre a leitura das referências."""
+        with self._lock:
+            return self._segments, self._deleted()
+
+    def _dead(self, seg: _Segment, deleted: Optional[Dict[str, List[int]]] = None) -> np.ndarray:
+        """Posições apagadas (tombstones) do segmento."""
+        deleted = self._deleted() if deleted is None else deleted
+        return np.asarray(deleted.get(seg.name, ()), dtype="int64")
+
+    @property
+    def deleted_count(self) -> int:
+        return sum(len(pos) for pos in self._manifest.get("deleted", {}).values())
+
+    def _save_manifest(self) -> None:
+        self._manifest["generation"] += 1
+        self._manifest["segments"] = [
+            {"name": seg.name, "count": len(seg)} for seg in self._segments
+        ]
+        manifest_path = self.path / MANIFEST_FILE
+        _write_json_atomic(manifest_path, self._manifest)
+        self._manifest_mtime = manifest_path.stat().st_mtime_ns
+
+    def _next_segment_name(self) -> str:
+        """
+        Próximo nome livre. O contador só é salvo junto com o manifesto: uma
+        queda entre o ``os.replace`` do segmento e o manifesto deixa uma pasta
+        órfã com o nome "reservado" → pula qualquer ``seg-N`` já em disco.
+        """
+        with self._lock:
+            taken = [
+                int(entry.name[4:].split(".")[0])
+                for entry in (self.path / SEGMENTS_DIR).glob("seg-*")
+                if entry.name[4:].split(".")[0].isdigit()
+            ]
+            number = max([self._manifest["next_segment"], *(n + 1 for n in taken)])
+            self._manifest["next_segment"] = number + 1
+            return f"seg-{number:06d}"
+
+    def _write_segment(
+        self,
+        index  : faiss.Index,
+        ids    : List[str],
+        docs   : Optional[List[LCDocument]] = None,
+        replace: bool = False,
+        exact  : np.ndarray | None = None,
+    ) -> _Segment:
+        """
+        Grava um segmento novo; ``replace`` → passa a ser o único (compactação,
+        tombstones zerados). ``docs`` vão para o docstore ANTES do manifesto
+        apontar para os vetores. Chamado com ``_write_lock``; docstore e disco
+        ficam fora de ``_lock`` — só a publicação (lista + manifesto) o toma.
+        """
+        if docs:
+            self.docstore.add(docs)
+        segment = _Segment(self._next_segment_name(), index, ids, exact)
+        segment.save(self.path / SEGMENTS_DIR / segment.name)
+
+        with self._lock:
+            if replace:
+                self._manifest["deleted"] = {}
+                self._set_segments([segment])
+            else:
+                self._append_segment(segment)
+            self._save_manifest()
+        return segment
+
+    # ───────── informações
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @property
+    def generation(self) -> int:
+        """Muda a cada escrita — serve para invalidar caches dependentes do índice."""
+        return self._manifest["generation"]
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    def target_index_type(self) -> str:
+        """
+        Tipo desejado para o corpus atual: override do construtor → tipo
+        forçado por ``compact(index_type=...)`` (salvo no manifesto) → automático.
+        """
+        if self.index_type != "auto":
+            return self.index_type
+        return self._manifest.get("index_type") or choose_index_type(len(self))
+
+    def index_info(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "segmento"     : seg.name,
+                "tipo"         : index_type_of(seg.index),
+                "armazenamento": storage_of(seg.index),
+                "vetores"      : len(seg),
+                "apagados"     : len(self._dead(seg)),
+            }
+            for seg in self._segments
+        ]
+
+    def _needs_migration(self) -> bool:
+        """O maior segmento não é do tipo que o corpus atual pede?"""
+        if not self._segments:
+            return False
+        main = max(self._segments, key=len)
+        return (
+            index_type_of(main.index) != self.target_index_type()
+            or main.index.metric_type != faiss.METRIC_INNER_PRODUCT
+            or storage_of(main.index) != _effective_storage(self.storage, len(main))
+        )
+
+    def __contains__(self, chunk_id: object) -> bool:
+        return chunk_id in self._where
+
+    def __len__(self) -> int:
+        return sum(len(seg) for seg in self._segments) - self.deleted_count   # ids vivos
+
+    def get_by_ids(self, ids: Iterable[str], /) -> List[LCDocument]:
+        where = self._where
+        return [doc for doc in self.docstore.mget([cid for cid in ids if cid in where]) if doc]
+
+    def _docs_for(self, hits: List[Tuple[float, _Segment, int]]) -> List[LCDocument]:
+        """Documentos das posições retornadas — uma consulta ao docstore."""
+        return self.docstore.mget([seg.ids[p] for _, seg, p in hits])
+
+    # ───────── escrita
+    def _exact(self, vectors: np.ndarray) -> np.ndarray | None:
+        """Vetores float32 para re-pontuação — só quando o índice é comprimido."""
+        return None if self.storage == "float32" else vectors
+
+    def add_texts(
+        self,
+        texts    : Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids      : Optional[List[str]]  = None,
+        **kwargs : Any,
+    ) -> List[str]:
+        texts     = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids       = ids or [hashlib.md5(t.encode()).hexdigest() for t in texts]
+
+        # embedding sem lock nenhum: buscas e outras ingestões seguem em paralelo
+        self.refresh()
+        keep = self._new_positions(ids)
+        if not keep:
+            return []
+        texts     = [texts[i] for i in keep]
+        metadatas = [metadatas[i] for i in keep]
+        ids       = [ids[i] for i in keep]
+        vectors   = _normalized(self.embedding.embed_documents(texts))
+
+        with self._write_lock:
+            self.refresh()
+            keep = self._new_positions(ids)                      # gravados enquanto embeddava
+            if not keep:
+                return []
+            ids, vectors = [ids[i] for i in keep], vectors[keep]
+            index = build_index(vectors, "flat", self.storage)   # segmento novo = pequeno
+            docs  = [
+                LCDocument(id=ids[j], page_content=texts[i], metadata=metadatas[i])
+                for j, i in enumerate(keep)
+            ]
+            self._write_segment(index, ids, docs, exact=self._exact(vectors))
+            crowded = len(self._segments) > COMPACT_MAX_SEGMENTS or self._needs_migration()
+
+        if crowded:
+            self.compact()
+        return ids
+
+    def _new_positions(self, ids: List[str]) -> List[int]:
+        """Posições de ``ids`` ainda fora do índice (e não repetidas no próprio lote)."""
+        where = self._where
+        seen: set[str] = set()
+        keep: List[int] = []
+        for i, cid in enumerate(ids):
+            if cid in where or cid in seen:
+                continue
+            seen.add(cid)
+            keep.append(i)
+        return keep
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        Apaga chunks por ID: tombstone no manifesto + remoção do docstore.
+        Os vetores saem na compactação (automática acima de
+        ``TOMBSTONE_COMPACT_RATIO`` apagados). False se nenhum ID existia.
+        """
+        if not ids:
+            return False
+        with self._write_lock:
+            self.refresh()
+            where = self._where
+            found = [cid for cid in dict.fromkeys(ids) if cid in where]
+            if not found:
+                return False
+            with self._lock:
+                deleted = {name: list(pos) for name, pos in self._deleted().items()}
+                for cid in found:
+                    s, pos = where[cid]
+                    deleted.setdefault(self._segments[s].name, []).append(pos)
+                self._manifest["deleted"] = deleted
+                self._set_segments(self._segments)              # remonta ``_where``
+                self._save_manifest()                           # buscas deixam de vê-los
+            self.docstore.delete(found)
+
+            total   = sum(len(seg) for seg in self._segments)
+            crowded = self.deleted_count > total * TOMBSTONE_COMPACT_RATIO
+
+        if crowded:
+            self.compact()
+        return True
+
+    def compact(self, index_type: str | None = None) -> None:
+        """
+        Funde todos os segmentos num só índice do tipo alvo e remove os antigos.
+        ``index_type`` força a migração para um tipo específico e fica salvo
+        no manifesto (``add_texts`` não desfaz); ``"auto"`` volta à escolha
+        pelo tamanho do corpus. Posições apagadas (tombstones) ficam de fora.
+
+        Só escritores esperam: o índice novo é montado fora de ``_lock`` e as
+        buscas seguem nos segmentos antigos até a troca.
+        """
+        if index_type is not None and index_type != "auto" and index_type not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice inválido: {index_type!r}")
+        with self._write_lock:
+            self.refresh()
+            if index_type is not None:
+                with self._lock:
+                    if index_type == "auto":
+                        self._manifest.pop("index_type", None)
+                    else:
+                        self._manifest["index_type"] = index_type
+            target = self.target_index_type()
+            old, deleted = self._snapshot()
+            if not old or (len(old) == 1 and not deleted and not self._needs_migration()):
+                if index_type is not None:
+                    with self._lock:
+                        self._save_manifest()                   # persiste a escolha mesmo sem reconstruir
+                return
+            live = []
+            for seg in old:
+                mask = np.ones(len(seg), dtype=bool)
+                mask[self._dead(seg, deleted)] = False
+                live.append(mask)
+            ids = [cid for seg, mask in zip(old, live) for cid, ok in zip(seg.ids, mask) if ok]
+
+            if ids:
+                vectors = _normalized(np.vstack([seg.vectors()[mask] for seg, mask in zip(old, live)]))
+                index   = build_index(vectors, target, self.storage)
+                self._write_segment(index, ids, replace=True, exact=self._exact(vectors))
+            else:                                               # tudo apagado → índice vazio
+                with self._lock:
+                    self._manifest["deleted"] = {}
+                    self._set_segments([])
+                    self._save_manifest()
+            for seg in old:
+                shutil.rmtree(self.path / SEGMENTS_DIR / seg.name, ignore_errors=True)
+
+    # ───────── busca
+    def _search_batch(
+        self, embeddings: List[List[float]], fetch_k: int,
+    ) -> List[List[Tuple[float, _Segment, int]]]:
+        """
+        Para cada consulta: (cosseno, segmento, posição) dos ``fetch_k``
+        melhores em todos os segmentos. Uma busca matricial por segmento.
+        """
+        self.refresh()
+        segments, deleted = self._snapshot()
+        queries = _normalized(embeddings)
+        hits: List[List[Tuple[float, _Segment, int]]] = [[] for _ in embeddings]
+        for seg in segments:
+            dead = self._dead(seg, deleted)
+            if len(seg) <= len(dead):
+                continue
+            for row, (sims, pos) in zip(hits, seg.search_batch(queries, fetch_k + len(dead))):
+                if len(dead):
+                    alive = ~np.isin(pos, dead)
+                    sims, pos = sims[alive][:fetch_k], pos[alive][:fetch_k]
+                row += [(float(d), seg, int(p)) for d, p in zip(sims, pos)]
+        for row in hits:
+            row.sort(key=lambda h: -h[0])                       # maior cosseno primeiro
+        return [row[:fetch_k] for row in hits]
+
+    def _search(self, embedding: List[float], fetch_k: int) -> List[Tuple[float, _Segment, int]]:
+        return self._search_batch([embedding], fetch_k)[0]
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any,
+    ) -> List[Tuple[LCDocument, float]]:
+        hits = self._search(embedding, k)
+        return list(zip(self._docs_for(hits), [d for d, _, _ in hits]))
+
+    def similarity_search_with_score_batch(
+        self, embeddings: List[List[float]], k: int = 4,
+    ) -> List[List[Tuple[LCDocument, float]]]:
+        """``similarity_search_with_score_by_vector`` para várias consultas em lote."""
+        return [
+            list(zip(self._docs_for(hits), [d for d, _, _ in hits]))
+            for hits in self._search_batch(embeddings, k)
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any,
+    ) -> List[Tuple[LCDocument, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any,
+    ) -> List[LCDocument]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[LCDocument]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding  : List[float],
+        k          : int   = 4,
+        fetch_k    : int   = 20,
+        lambda_mult: float = 0.5,
+        **kwargs   : Any,
+    ) -> List[LCDocument]:
+        return self._mmr(embedding, self._search(embedding, fetch_k), k, lambda_mult)
+
+    def max_marginal_relevance_search_batch(
+        self,
+        embeddings : List[List[float]],
+        k          : int   = 4,
+        fetch_k    : int   = 20,
+        lambda_mult: float = 0.5,
+    ) -> List[List[LCDocument]]:
+        """MMR para várias consultas; a busca de candidatos é feita em lote."""
+        return [
+            self._mmr(embedding, hits, k, lambda_mult)
+            for embedding, hits in zip(embeddings, self._search_batch(embeddings, fetch_k))
+        ]
+
+    def _mmr(
+        self,
+        embedding  : List[float],
+        hits       : List[Tuple[float, _Segment, int]],
+        k          : int,
+        lambda_mult: float,
+    ) -> List[LCDocument]:
+        if not hits:
+            return []
+        candidates = np.vstack([seg.vector(p) for _, seg, p in hits])
+        chosen = maximal_marginal_relevance(
+            np.asarray(embedding, dtype="float32"), candidates, lambda_mult=lambda_mult, k=k,
+        )
+        return self._docs_for([hits[i] for i in chosen])
+
+    def max_marginal_relevance_search(
+        self,
+        query      : str,
+        k          : int   = 4,
+        fetch_k    : int   = 20,
+        lambda_mult: float = 0.5,
+        **kwargs   : Any,
+    ) -> List[LCDocument]:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding.embed_query(query), k, fetch_k, lambda_mult,
+        )
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score                              # já é cosseno
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts    : List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        path     : Path,
+        ids      : Optional[List[str]]  = None,
+        **kwargs : Any,
+    ) -> "SegmentedFAISS":
+        vs = cls.open(path, embedding)
+        vs.add_texts(texts, metadatas, ids=ids)
+        return vs
+
+
+# ═════ Relatório memória × recall ═════
+def compression_report(
+    vs       : SegmentedFAISS,
+    storages : Iterable[str] = VECTOR_STORAGES,
+    k        : int = 10,
+    n_queries: int = 200,
+    max_vectors: int = 50_000,
+) -> List[Dict[str, Any]]:
+    """
+    Compara os modos de armazenamento sobre os vetores do próprio índice.
+
+    Consultas = vetores do corpus com ruído (simula perguntas próximas);
+    verdade = busca exata float32. Mede bytes/vetor (índice serializado),
+    recall@k bruto e com re-pontuação exata, e latência por consulta.
+
+    A amostra (até ``max_vectors``) é sorteada por posição em cada segmento
+    e só essas linhas são lidas do memmap/índice. Índice vazio → ``[]``.
+    """
+    segments, deleted = vs._snapshot()
+    alive = [np.setdiff1d(np.arange(len(seg)), vs._dead(seg, deleted)) for seg in segments]
+    total = sum(len(pos) for pos in alive)
+    if not total:
+        return []
+
+    rng  = np.random.default_rng(0)
+    pick = np.sort(rng.choice(total, min(total, max_vectors), replace=False))
+    starts = np.cumsum([0] + [len(pos) for pos in alive])
+    rows   = []
+    for seg, pos, lo in zip(segments, alive, starts):
+        chosen = pick[(pick >= lo) & (pick < lo + len(pos))] - lo   # índices globais → do segmento
+        if len(chosen):
+            rows.append(seg.vectors_at(pos[chosen]))
+    vectors = _normalized(np.vstack(rows))
+    n       = len(vectors)
+    k       = min(k, n)
+    queries = _normalized(
+        vectors[rng.choice(n, min(n_queries, n), replace=False)]
+        + rng.normal(0, 0.05, (min(n_queries, n), vectors.shape[1])).astype("float32")
+    )
+
+    exact_index = faiss.IndexFlatIP(vectors.shape[1])
+    exact_index.add(vectors)
+    _, truth = exact_index.search(queries, k)
+
+    def recall(found: np.ndarray) -> float:
+        return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+    index_type = vs.target_index_type()
+    rows: List[Dict[str, Any]] = []
+    for storage in storages:
+        index = build_index(vectors, index_type, storage)
+        size  = faiss.serialize_index(index).nbytes / n
+
+        start = time.perf_counter()
+        _, raw = index.search(queries, k)
+        _, cand = index.search(queries, min(k * RERANK_FACTOR, n))
+        rescored = [
+            c[c != -1][np.argsort(-(vectors[c[c != -1]] @ q))[:k]]
+            for c, q in zip(cand, queries)
+        ]
+        latency = (time.perf_counter() - start) / len(queries) * 1000
+
+        rows.append({
+            "armazenamento"        : _effective_storage(storage, n),
+            "tipo"                 : index_type,
+            "bytes_por_vetor"      : round(size),
+            "memória_corpus_MB"    : round(size * len(vs) / 1e6, 1),
+            f"recall@{k}"          : round(recall(raw), 3),
+            f"recall@{k}_rescore"  : round(recall(rescored), 3),
+            "ms_por_consulta"      : round(latency, 2),
+        })
+    return rows
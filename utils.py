@@ -1,5 +1,6 @@
 import os
-from typing import List
+from functools import lru_cache, wraps
+from typing import Iterable, Iterator, List, Tuple
 import time
 import hashlib
 from langchain_core.documents import Document as LCDocument
@@ -7,11 +8,45 @@ from transformers import AutoTokenizer
 from typing import Union
 from pathlib import Path
 
+from rag_tracing import span
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name: str = "intfloat/multilingual-e5-large"):
+    """Tokenizer carregado uma única vez por modelo (registro em memória)."""
+    return AutoTokenizer.from_pretrained(model_name)
+
 
 def count_tokens(text: str, model_name: str = "intfloat/multilingual-e5-large") -> int:
     """Conta quantos tokens o texto possui com base no modelo informado."""
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    return len(tokenizer.encode(text))
+    return len(get_tokenizer(model_name).encode(text))
+
+
+def pack_documents(
+    documents : List[LCDocument],
+    budget    : int,
+    model_name: str = "intfloat/multilingual-e5-large",
+) -> Tuple[List[LCDocument], int]:
+    """
+    Seleciona documentos (na ordem recebida = melhores primeiro) até o
+    orçamento de tokens. Devolve (documentos escolhidos, tokens usados).
+    """
+    if not documents or budget <= 0:
+        return [], 0
+    tokenizer = get_tokenizer(model_name)
+    lengths   = [
+        len(ids) + 2                                   # + separador "\n\n" do stuff chain
+        for ids in tokenizer(
+            [d.page_content for d in documents], add_special_tokens=False,
+        )["input_ids"]
+    ]
+    packed, used = [], 0
+    for doc, n in zip(documents, lengths):
+        if used + n > budget:
+            continue                                   # não cabe → tenta os próximos
+        packed.append(doc)
+        used += n
+    return packed, used
 
 def prefix_documents_for_e5(documents: List[LCDocument]) -> List[LCDocument]:
     """Adiciona prefixo 'passage:' no conteúdo dos documentos (necessário para E5 embeddings)."""
@@ -19,6 +54,10 @@ def prefix_documents_for_e5(documents: List[LCDocument]) -> List[LCDocument]:
         doc.page_content = f"passage: {doc.page_content.strip()}"
     return documents
 
+def prefix_queries_for_e5(questions: List[str]) -> List[str]:
+    """Adiciona prefixo 'query:' nas perguntas (par do 'passage:' dos documentos no E5)."""
+    return [f"query: {q.strip()}" for q in questions]
+
 def hash_filename(filename: str) -> str:
     """Gera um nome de arquivo hash único baseado no nome original."""
     base, ext = os.path.splitext(filename)
@@ -27,13 +66,11 @@ def hash_filename(filename: str) -> str:
 
 
 def log_time(func):
-    """Decorator para medir o tempo de execução de uma função."""
+    """Decorator para medir o tempo de execução de uma função (span ``func.__name__``)."""
+    @wraps(func)
     def wrapper(*args, **kwargs):
-        start = time.time()
-        result = func(*args, **kwargs)
-        duration = time.time() - start
-        print(f"⏱️ {func.__name__} levou {duration:.2f}s para executar.")
-        return result
+        with span(func.__name__):
+            return func(*args, **kwargs)
     return wrapper
 
 
@@ -49,4 +86,24 @@ def ensure_directory(path: Union[str, Path]) -> None:
 
 def format_response(text: str) -> str:
     """Formata a resposta da IA removendo espaços extras e limpando markdown."""
-    return text.strip().replace("\n\n", "\n")
\ No newline at end of file
+    return text.strip().replace("\n\n", "\n")
+
+
+def format_response_stream(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Versão incremental de ``format_response``: o texto concatenado é idêntico
+    ao de ``format_response`` aplicado à resposta completa. Espaços finais
+    ficam retidos até chegar texto depois deles (ou são descartados no fim).
+    """
+    pending, started = "", False
+    for chunk in chunks:
+        text = pending + chunk
+        if not started:
+            text = text.lstrip()
+            if not text:
+                continue
+            started = True
+        body    = text.rstrip()
+        pending = text[len(body):]
+        if body:
+            yield body.replace("\n\n", "\n")